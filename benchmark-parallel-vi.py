@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import time
+
+import numpy as np
+
+import gridworld
+import solvers
+import valuestore
+
+# Scaling benchmark of solvers.parallelTiledValueIteration() from one worker
+# up to all cores, against the serial tiledValueIteration(). Each grid has
+# the goal in the bottom-right corner, one water cell and randomly placed
+# obstacles. Reports wall time, sweeps, time per sweep, speedup and parallel
+# efficiency over the serial solver, and whether the policy is identical.
+
+GRID_SIZES = [500, 1000]
+OBSTACLE_FRACTION = 0.1
+DISCOUNT_FACTOR = 0.9
+THRESHOLD = 0.0001
+VALUE_DTYPE = np.float64
+TILE_ROWS = 64
+SEED = 0
+
+
+def workerCounts():
+    counts = [1]
+    while counts[-1] * 2 <= (os.cpu_count() or 1):
+        counts.append(counts[-1] * 2)
+    if counts[-1] != (os.cpu_count() or 1):
+        counts.append(os.cpu_count() or 1)
+    return counts
+
+
+def randomGridworld(gridSize, rng):
+    goalState = (gridSize-1, gridSize-1)
+    cells = rng.choice(gridSize * gridSize - 2, size=int(OBSTACLE_FRACTION * gridSize * gridSize) + 1, replace=False) + 1
+    cells = [divmod(int(c), gridSize) for c in cells]
+    return gridworld.Gridworld(gridSize, gridSize, goals=[goalState], water=cells[:1], obstacles=cells[1:])
+
+
+def layoutArrays(env):
+    shape = (env.rows, env.cols)
+    return env.cellRewards.reshape(shape), env.isObstacle.reshape(shape), env.active.reshape(shape), env.outcomeTable()
+
+
+def timed(function, *args, **kwargs):
+    start = time.perf_counter()
+    result = function(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def benchmarkGrid(gridSize, rng):
+    env = randomGridworld(gridSize, rng)
+    layout = layoutArrays(env)
+
+    print(f"{gridSize}x{gridSize} grid, {len(env.obstacles)} obstacles")
+    print(f"{'solver':<16} {'workers':>7} {'sweeps':>7} {'seconds':>9} {'s/sweep':>9} {'speedup':>8} {'efficiency':>10} {'same policy':>12}")
+
+    store = valuestore.ValueStore(env.rows, env.cols, VALUE_DTYPE)
+    (serialV, serialPolicy, serialSweeps), serialSeconds = timed(solvers.tiledValueIteration, *layout, DISCOUNT_FACTOR, THRESHOLD,
+                                                                 store, tileRows=TILE_ROWS)
+    serialPolicy = np.array(serialPolicy)
+    print(f"{'tiled':<16} {1:>7} {serialSweeps:>7} {serialSeconds:>9.3f} {serialSeconds / (serialSweeps + 1):>9.4f} {1.0:>8.2f} {1.0:>10.2f} {'-':>12}")
+
+    for workers in workerCounts():
+        store = valuestore.ValueStore(env.rows, env.cols, VALUE_DTYPE)
+        (V, policy, sweeps), seconds = timed(solvers.parallelTiledValueIteration, *layout, DISCOUNT_FACTOR, THRESHOLD,
+                                             store, workers=workers, tileRows=TILE_ROWS)
+        speedup = serialSeconds / seconds
+        samePolicy = bool(np.array_equal(policy, serialPolicy))
+        print(f"{'parallel-tiled':<16} {workers:>7} {sweeps:>7} {seconds:>9.3f} {seconds / (sweeps + 1):>9.4f} {speedup:>8.2f} {speedup / workers:>10.2f} {str(samePolicy):>12}")
+
+    print()
+
+
+def main():
+    rng = np.random.default_rng(SEED)
+    print(f"{os.cpu_count()} cores available")
+    print()
+    for gridSize in GRID_SIZES:
+        benchmarkGrid(gridSize, rng)
+
+
+if __name__ == '__main__':
+    main()
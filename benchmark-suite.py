@@ -0,0 +1,364 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import argparse
+import contextlib
+import datetime
+import importlib.util
+import io
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import gridworld
+import instrumentation
+import rollouts
+import solvers
+import valuestore
+
+# Benchmark suite for the hot paths: the solvers and the episode simulators
+# on square gridworlds from 5x5 up to 2000x2000 with the goal in the
+# bottom-right corner, one water cell and randomly placed obstacles.
+#
+# Every case (grid size, phase, implementation) runs in a fresh process so
+# its peak RSS is its own. The solve phase times the solver alone and reports
+# sweeps/sec and backups/sec (one backup = one state's Bellman update);
+# solvers with a sweep limit stop after MAX_SWEEPS so the large grids finish
+# in minutes. The evaluate phase simulates episodes of a policy that follows
+# the shortest path to the goal (it needs no solve, and is what a converged
+# policy does on most layouts) and of the uniform random policy, reporting
+# episodes/sec and steps/sec. Setup (building the model, the layout arrays
+# or the policy) is timed separately and not part of the rates.
+#
+# Results are written as JSON to --output. With a baseline file (written by
+# an earlier run with --save-baseline) every rate that dropped, or peak RSS
+# that grew, by more than --tolerance is reported as a regression and the
+# exit status is 1.
+
+GRID_SIZES = [5, 50, 200, 1000, 2000]
+OBSTACLE_FRACTION = 0.1
+DISCOUNT_FACTOR = 0.9
+THRESHOLD = 0.0001
+MAX_SWEEPS = 100 # sweep limit of the sparse and tiled solvers
+TILE_ROWS = 256
+PYTHON_SOLVE_MAX_GRID = 50 # value-iteration.py valueIteration() only up to this size
+SPARSE_MAX_GRID = 1000 # the CSR model of larger grids needs gigabytes
+PYTHON_UNIFORM_MAX_GRID = 10 # random walks without a step limit only up to this size
+EPISODES = 10000 # episodes per batched simulator case
+PYTHON_EPISODES = 1000 # episodes per python simulator case
+MAX_EPISODE_STEPS = 10000 # step limit of the batched simulators
+MIN_CASE_SECONDS = 1.0 # short cases are repeated until they ran this long, and the fastest run counts
+SEED = 0
+RESULTS_FILE = "benchmark-results.json"
+BASELINE_FILE = "benchmark-baseline.json"
+TOLERANCE = 0.2 # allowed relative slowdown (or RSS growth) before a result counts as a regression
+
+RATE_METRICS = ["sweepsPerSec", "backupsPerSec", "episodesPerSec", "stepsPerSec"]
+
+
+def caseList(gridSizes):
+    cases = []
+    for gridSize in gridSizes:
+        if gridSize <= PYTHON_SOLVE_MAX_GRID:
+            cases.append((gridSize, "solve", "python"))
+        if gridSize <= SPARSE_MAX_GRID:
+            cases.append((gridSize, "solve", "sparse"))
+        cases.append((gridSize, "solve", "tiled"))
+        cases.append((gridSize, "evaluate", "python-optimal"))
+        cases.append((gridSize, "evaluate", "batched-optimal"))
+        if gridSize <= PYTHON_UNIFORM_MAX_GRID:
+            cases.append((gridSize, "evaluate", "python-uniform"))
+        cases.append((gridSize, "evaluate", "batched-uniform"))
+    return cases
+
+
+# Random layout for gridSize, the same for every case of that size. Layouts
+# where the start cannot reach the goal are redrawn.
+def gridConfig(gridSize):
+    rng = np.random.default_rng([SEED, gridSize])
+    goalState = (gridSize-1, gridSize-1)
+    while True:
+        cells = rng.choice(gridSize * gridSize - 2, size=int(OBSTACLE_FRACTION * gridSize * gridSize) + 1, replace=False) + 1
+        cells = [divmod(int(c), gridSize) for c in cells]
+        config = dict(rows=gridSize, cols=gridSize, start=(0, 0), goals=[goalState], water=cells[:1], obstacles=cells[1:])
+        env = gridworld.getGridworld(**config)
+        if env.goalDistances()[env.startIndex] >= 0:
+            return config
+
+
+# Deterministic policy moving one step closer to the nearest goal everywhere
+# a goal is reachable, -1 elsewhere
+def distancePolicy(env):
+    distance = env.goalDistances()
+    policy = np.full(env.numStates, -1, dtype=np.int8)
+    for a in reversed(range(len(gridworld.ACTIONS))):
+        m = gridworld.MOVES.index(gridworld.ACTIONS[a])
+        closer = ~env.blocked[:, m] & (distance[env.nextStates[:, m]] == distance - 1) & (distance > 0)
+        policy[closer] = a
+    return policy
+
+
+# Steps of an episode following a deterministic policy from the start state
+def episodeLength(env, policy):
+    nextIndex = env.policySteps(policy)[0].tolist()
+    isTerminal = env.isTerminal.tolist()
+    state, steps = env.startIndex, 0
+    while not isTerminal[state]:
+        state = nextIndex[state]
+        steps += 1
+    return steps
+
+
+def loadScript(filename, config):
+    spec = importlib.util.spec_from_file_location(filename.replace("-", "_")[:-3], os.path.join(os.path.dirname(os.path.abspath(__file__)), filename))
+    module = importlib.util.module_from_spec(spec)
+    with contextlib.redirect_stdout(io.StringIO()):
+        spec.loader.exec_module(module)
+    module.GRID_CONFIG = config
+    module.DISCOUNT_FACTOR = DISCOUNT_FACTOR
+    return module
+
+
+# Calls run() until MIN_CASE_SECONDS have passed, at least once. Returns the
+# result of the last call and the time of the fastest.
+def timed(run):
+    best, total = float("inf"), 0.0
+    while total < MIN_CASE_SECONDS:
+        start = time.perf_counter()
+        result = run()
+        seconds = time.perf_counter() - start
+        best, total = min(best, seconds), total + seconds
+    return result, best
+
+
+def peakRssMB():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def solveCase(env, config, implementation):
+    start = time.perf_counter()
+    if implementation == "python":
+        script = loadScript("value-iteration.py", config)
+        script.THRESHOLD = THRESHOLD
+        script.PROGRESS = "quiet"
+        script.environment().environmentModel()
+        setup = time.perf_counter() - start
+        # valueIteration() only returns dicts, its sweeps are counted by the observer
+        sweeps = []
+        observer = lambda iteration, delta, elapsed, V: sweeps.append(iteration)
+        with contextlib.redirect_stdout(io.StringIO()):
+            _, seconds = timed(lambda: (sweeps.clear(), script.valueIteration(observer)))
+        sweeps, converged = len(sweeps), True
+    elif implementation == "sparse":
+        model = env.sparseModel()
+        setup = time.perf_counter() - start
+        (V, policy, iteration), seconds = timed(lambda: solvers.sparseValueIteration(model, env.cellRewards, env.active, DISCOUNT_FACTOR,
+                                                                                     THRESHOLD, maxIterations=MAX_SWEEPS))
+        sweeps = iteration + 1
+        converged = sweeps < MAX_SWEEPS
+    else:
+        shape = (env.rows, env.cols)
+        layout = env.cellRewards.reshape(shape), env.isObstacle.reshape(shape), env.active.reshape(shape), env.outcomeTable()
+        setup = time.perf_counter() - start
+        # the store is allocated per run, finishing a solve drops its scratch buffer
+        (V, policy, iteration), seconds = timed(lambda: solvers.tiledValueIteration(*layout, DISCOUNT_FACTOR, THRESHOLD, valuestore.ValueStore(env.rows, env.cols),
+                                                                                    tileRows=TILE_ROWS, maxIterations=MAX_SWEEPS))
+        sweeps = iteration + 1
+        converged = sweeps < MAX_SWEEPS
+
+    backups = sweeps * int(env.active.sum())
+    return {
+        "setupSeconds": setup,
+        "seconds": seconds,
+        "sweeps": sweeps,
+        "converged": converged,
+        "backups": backups,
+        "sweepsPerSec": sweeps / seconds,
+        "backupsPerSec": backups / seconds,
+    }
+
+
+def evaluateCase(env, config, implementation):
+    start = time.perf_counter()
+    counters = {"steps": 0}
+    policy = distancePolicy(env) if implementation.endswith("optimal") else None
+
+    if implementation == "python-optimal":
+        script = loadScript("value-iteration.py", config)
+        script.MAX_EPISODES = PYTHON_EPISODES
+        script.TOLERANCE = None
+        script.environment()
+        setup = time.perf_counter() - start
+        stats, seconds = timed(lambda: script.runOptimalPolicy(policy))
+        # every episode of a deterministic policy takes the same path
+        counters["steps"] = stats.count * episodeLength(env, policy)
+    elif implementation == "python-uniform":
+        script = loadScript("uniform-selection.py", config)
+        script.MAX_EPISODES = PYTHON_EPISODES
+        script.TOLERANCE = None
+        script.environment().environmentModel()
+        setup = time.perf_counter() - start
+
+        # the python random walk reports its steps through the instrumentation counters
+        def run():
+            np.random.seed(SEED)
+            with instrumentation.Instrumentation("benchmark") as probe:
+                stats = script.uniformRandomSelection()
+            counters["steps"] = probe.counters["steps"]
+            return stats
+        with contextlib.redirect_stdout(io.StringIO()):
+            stats, seconds = timed(run)
+    else:
+        nextStates, stepRewards, isTerminal = env.stepTable()
+        setup = time.perf_counter() - start
+
+        def run():
+            counters["steps"] = 0
+            return rollouts.streamRollouts(nextStates, stepRewards, isTerminal, env.startIndex, EPISODES, DISCOUNT_FACTOR,
+                                           policy=policy, rng=np.random.default_rng(SEED), maxSteps=MAX_EPISODE_STEPS, counters=counters)
+        stats, seconds = timed(run)
+
+    steps = counters["steps"]
+    return {
+        "setupSeconds": setup,
+        "seconds": seconds,
+        "episodes": stats.count,
+        "steps": steps,
+        "meanReturn": stats.mean,
+        "episodesPerSec": stats.count / seconds,
+        "stepsPerSec": steps / seconds,
+    }
+
+
+# Runs one case, in its own process
+def runCase(case):
+    gridSize, phase, implementation = case
+    config = gridConfig(gridSize)
+    env = gridworld.getGridworld(**config)
+
+    if phase == "solve":
+        result = solveCase(env, config, implementation)
+    else:
+        result = evaluateCase(env, config, implementation)
+
+    return dict(grid=gridSize, phase=phase, implementation=implementation, **result, peakRssMB=peakRssMB())
+
+
+def machineInfo():
+    return {
+        "platform": platform.platform(),
+        "processor": platform.processor(),
+        "cpus": os.cpu_count(),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+    }
+
+
+def settings():
+    return {
+        "obstacleFraction": OBSTACLE_FRACTION,
+        "discount": DISCOUNT_FACTOR,
+        "threshold": THRESHOLD,
+        "maxSweeps": MAX_SWEEPS,
+        "tileRows": TILE_ROWS,
+        "episodes": EPISODES,
+        "pythonEpisodes": PYTHON_EPISODES,
+        "maxEpisodeSteps": MAX_EPISODE_STEPS,
+        "minCaseSeconds": MIN_CASE_SECONDS,
+        "seed": SEED,
+    }
+
+
+def formatRate(value):
+    return "-" if value is None else f"{value:.4g}"
+
+
+def printResult(result):
+    rates = " ".join(f"{formatRate(result.get(metric)):>14}" for metric in RATE_METRICS)
+    print(f"{result['grid']:>5} {result['phase']:<9} {result['implementation']:<16} {result['seconds']:>9.3f} {rates} {result['peakRssMB']:>9.1f}")
+
+
+def caseKey(result):
+    return (result["grid"], result["phase"], result["implementation"])
+
+
+# Results that got slower (any rate) or bigger (peak RSS) than the baseline by
+# more than tolerance, as (result, metric, baseline value, current value)
+def findRegressions(results, baseline, tolerance):
+    previous = {caseKey(result): result for result in baseline["results"]}
+    regressions = []
+    for result in results:
+        old = previous.get(caseKey(result))
+        if old is None:
+            continue
+        for metric in RATE_METRICS:
+            if result.get(metric) is not None and old.get(metric) and result[metric] < old[metric] * (1 - tolerance):
+                regressions.append((result, metric, old[metric], result[metric]))
+        if result["peakRssMB"] > old["peakRssMB"] * (1 + tolerance):
+            regressions.append((result, "peakRssMB", old["peakRssMB"], result["peakRssMB"]))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the gridworld solvers and simulators.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=GRID_SIZES, help="grid sizes to run")
+    parser.add_argument("--output", default=RESULTS_FILE, help="JSON file for the results")
+    parser.add_argument("--baseline", default=BASELINE_FILE, help="JSON results to compare against, when the file exists")
+    parser.add_argument("--save-baseline", action="store_true", help="also write the results to the baseline file")
+    parser.add_argument("--tolerance", type=float, default=TOLERANCE, help="allowed relative regression")
+    args = parser.parse_args()
+
+    print(f"{'grid':>5} {'phase':<9} {'implementation':<16} {'seconds':>9} {'sweeps/s':>14} {'backups/s':>14} {'episodes/s':>14} {'steps/s':>14} {'peak MB':>9}")
+    results = []
+    context = multiprocessing.get_context("spawn")
+    for case in caseList(args.sizes):
+        with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+            result = pool.submit(runCase, case).result()
+        printResult(result)
+        results.append(result)
+
+    report = {
+        "created": datetime.datetime.now().isoformat(timespec="seconds"),
+        "machine": machineInfo(),
+        "settings": settings(),
+        "results": results,
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {args.output}")
+
+    regressions = []
+    if os.path.exists(args.baseline) and not args.save_baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline["settings"] != report["settings"]:
+            print(f"Warning: {args.baseline} was recorded with different settings")
+        regressions = findRegressions(results, baseline, args.tolerance)
+        print()
+        print(f"Compared with {args.baseline} ({baseline['created']}), tolerance {args.tolerance:.0%}:")
+        for result, metric, old, new in regressions:
+            print(f"  REGRESSION {result['grid']}x{result['grid']} {result['phase']}/{result['implementation']} "
+                  f"{metric}: {old:.4g} -> {new:.4g} ({new / old - 1:+.1%})")
+        if not regressions:
+            print("  no regressions")
+
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Baseline written to {args.baseline}")
+
+    if regressions:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
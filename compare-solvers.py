@@ -0,0 +1,114 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import contextlib
+import importlib.util
+import io
+import os
+import time
+
+import numpy as np
+
+import gridworld
+import solvers
+
+# Compares the array solvers in solvers.SOLVERS against the original
+# dict based valueIteration() from value-iteration.py. Each grid has the goal
+# in the bottom-right corner, one water cell and randomly placed obstacles.
+# Reports iterations (backups for prioritized sweeping), wall time, the
+# largest value difference from Jacobi value iteration and the fraction of
+# states whose action is greedy (within GREEDY_TOLERANCE) for that reference
+# value function. Far from the goal many actions tie, so exact agreement of
+# action indices would be misleading.
+
+GRID_SIZES = [5, 50, 150]
+OBSTACLE_FRACTION = 0.1
+DENSE_MAX_GRID = 30 # the dense P[a, s, s'] tensor is only built up to this size
+DISCOUNT_FACTOR = 0.9
+THRESHOLD = 0.0001
+MPI_SWEEPS = 10
+GREEDY_TOLERANCE = 10 * THRESHOLD
+SEED = 0
+
+
+def randomGridworld(gridSize, rng):
+    goalState = (gridSize-1, gridSize-1)
+    free = [(i, j) for i in range(gridSize) for j in range(gridSize) if (i, j) not in [(0, 0), goalState]]
+    picks = rng.permutation(len(free))
+    waterState = free[picks[0]]
+    numObstacles = int(OBSTACLE_FRACTION * gridSize * gridSize)
+    obstacles = [free[k] for k in picks[1:1+numObstacles]]
+    return gridworld.Gridworld(gridSize, gridSize, goals=[goalState], water=[waterState], obstacles=obstacles)
+
+
+def loadValueIterationScript():
+    spec = importlib.util.spec_from_file_location("value_iteration", os.path.join(os.path.dirname(os.path.abspath(__file__)), "value-iteration.py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def timed(function, *args, **kwargs):
+    start = time.perf_counter()
+    result = function(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def report(name, iterations, seconds, V, policy, referenceV, referenceQ, active):
+    maxDiff = np.max(np.abs(V - referenceV)[active], initial=0.0)
+    chosen = referenceQ[np.arange(referenceQ.shape[0]), policy]
+    greedy = np.mean((chosen >= referenceQ.max(axis=1) - GREEDY_TOLERANCE)[active])
+    print(f"{name:<28} {iterations:>10} {seconds:>10.4f} {maxDiff:>12.6f} {greedy:>10.4f}")
+
+
+def compareGrid(gridSize, rng):
+    env = randomGridworld(gridSize, rng)
+    model, V0, active = env.sparseModel(), env.cellRewards, env.active
+
+    print(f"{gridSize}x{gridSize} grid, {len(env.obstacles)} obstacles")
+    print(f"{'solver':<28} {'iterations':>10} {'seconds':>10} {'max |dV|':>12} {'greedy':>10}")
+
+    (refV, refPolicy, refIterations), seconds = timed(solvers.sparseValueIteration, model, V0, active, DISCOUNT_FACTOR, THRESHOLD)
+    refQ = solvers.sparseBackup(model, refV, DISCOUNT_FACTOR)
+    report("sparse", refIterations, seconds, refV, refPolicy, refV, refQ, active)
+
+    if gridSize <= DENSE_MAX_GRID:
+        P, R = env.transitionTensor()
+        (V, policy, iterations), seconds = timed(solvers.denseValueIteration, P, R, V0, active, DISCOUNT_FACTOR, THRESHOLD)
+        report("numpy (dense)", iterations, seconds, V, policy, refV, refQ, active)
+
+    for method in solvers.SOLVERS:
+        if method == "sparse":
+            continue
+        options = {}
+        if method == "gauss-seidel":
+            options["order"] = env.sweepOrder("bfs")
+        elif method == "modified-policy-iteration":
+            options["k"] = MPI_SWEEPS
+        (V, policy, iterations), seconds = timed(solvers.solve, method, model, V0, active, DISCOUNT_FACTOR, THRESHOLD, **options)
+        report(method, iterations, seconds, V, policy, refV, refQ, active)
+
+    print()
+
+
+def main():
+    rng = np.random.default_rng(SEED)
+
+    # the original 5x5 gridworld with the dict based solver as the baseline
+    script = loadValueIterationScript()
+    with contextlib.redirect_stdout(io.StringIO()):
+        (V, policy), seconds = timed(script.valueIteration)
+    print(f"value-iteration.py valueIteration() on the 5x5 grid: {seconds:.4f} seconds")
+    for method in ["numpy"] + list(solvers.SOLVERS):
+        with contextlib.redirect_stdout(io.StringIO()):
+            (arrayV, arrayPolicy), seconds = timed(script.vectorizedValueIteration, method)
+        samePolicy = np.array_equal(arrayPolicy, script.environment().policyArray(policy))
+        print(f"  {method:<26} {seconds:.4f} seconds, same policy: {samePolicy}")
+    print()
+
+    for gridSize in GRID_SIZES:
+        compareGrid(gridSize, rng)
+
+
+if __name__ == '__main__':
+    main()
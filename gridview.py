@@ -0,0 +1,472 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import time
+
+import numpy as np
+import pygame
+
+import gridworld
+import rollouts
+import solvers
+
+# Pillow is optional, it is only needed to export GIFs
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+# Pygame rendering of a gridworld.Gridworld, shared by the pygame scripts.
+# openDisplay() creates the display when a script starts (never at import):
+# a window, or with headless an off-screen surface of SDL's dummy video
+# driver so the scripts run on servers without a display. A GridView draws
+# the board and the agent onto it and plays back recorded episodes; the
+# static board is rendered once and each step only redraws and updates the
+# areas the agent left and entered (dirty rectangles). A FrameRecorder
+# captures the rendered frames as raw RGB bytes and encodes them in
+# batches, as PNG files or as one GIF per episode. GridView.playback()
+# replays episodes recorded in bulk by rollouts.recordRollouts(), with keys
+# to pause, fast-forward, skip to an episode and show every k-th step.
+# A HeatmapView draws a value function as a colour heatmap with policy
+# arrows from whole-grid pixel arrays (one surfarray blit per frame instead
+# of a draw call per cell), and heatmapObserver() feeds it from a solver's
+# observer callback, throttled so rendering takes a bounded share of the
+# solve time.
+
+BLOCK_SIZE = 100 # cell size in pixels
+MARGIN = 1 # pixels between cells
+BACKGROUND_COLOR = (0,0,0)
+CELL_COLOR = (255,255,255)
+OBSTACLE_COLOR = (255,0,0) # red
+WATER_COLOR = (30,144,255) # blue
+GOAL_COLOR = (124,252,0) # green
+TEXT_COLOR = (0,0,0)
+ROBOT_IMAGE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "robot.png")
+
+EXPORT_FORMATS = ["png", "gif"]
+FRAME_BATCH = 256 # frames buffered before a FrameRecorder encodes PNG files
+GIF_FRAME_MS = 100 # display time of a GIF frame
+PAUSE_MS = 20 # event polling interval while playback is paused
+
+PLAYBACK_FILTERS = [None, "water", "goal", "truncated"]
+
+HEATMAP_MAX_WINDOW = 1000 # largest heatmap window side in pixels
+ARROW_MIN_CELL = 8 # smallest heatmap cell in pixels that gets a policy arrow
+ARROW_COLOR = (0,0,0)
+NEGATIVE_COLOR = (215,48,39) # red, for the lowest reward and below
+ZERO_COLOR = (255,255,255)
+POSITIVE_COLOR = (26,152,80) # green, for the highest reward and above
+HEATMAP_OBSTACLE_COLOR = (64,64,64)
+FRAME_INTERVAL = 1 / 30 # least seconds between heatmap frames pushed by heatmapObserver()
+RENDER_FRACTION = 0.1 # largest share of the solve time heatmapObserver() spends rendering
+
+# Keys of the interactive GridView.playback()
+PLAYBACK_KEYS = {
+    "space": "pause / resume",
+    "right / left": "fast-forward (halve the frame time) / slow down (double it)",
+    "+ / -": "show every 2x / every 0.5x steps",
+    "n / b": "next / previous episode",
+    "digits, enter": "skip to episode N",
+    "q / escape": "stop playback",
+}
+
+
+# Creates the pygame display of size pixels: a window, or with headless an
+# off-screen surface of SDL's dummy video driver. headless has to be decided
+# before pygame's video system is first initialized.
+def openDisplay(size, headless=False, caption="Gridworld"):
+    if headless:
+        os.environ["SDL_VIDEODRIVER"] = "dummy"
+    pygame.init()
+    surface = pygame.display.set_mode(size)
+    surface.fill(BACKGROUND_COLOR)
+    pygame.display.set_caption(caption)
+    return surface
+
+
+# Indices of the episodes of a rollouts.TrajectoryLog from episode start on
+# that ended as kind: "water", "goal", "truncated" (cut off by a step limit)
+# or None for any
+def selectEpisodes(env, log, kind=None, start=0):
+    if kind not in PLAYBACK_FILTERS:
+        raise ValueError(f"unknown episode filter {kind!r}, expected one of {PLAYBACK_FILTERS}")
+    ends = rollouts.finalStates(log)
+    if kind == "water":
+        selected = np.isin(ends, [env.toIndex(cell) for cell in env.water])
+    elif kind == "goal":
+        selected = np.isin(ends, [env.toIndex(cell) for cell in env.goals])
+    elif kind == "truncated":
+        selected = ~env.isTerminal[ends]
+    else:
+        selected = np.ones(len(ends), dtype=bool)
+    selected[:start] = False
+    return np.flatnonzero(selected)
+
+
+# Exits when the window is closed
+def handleEvents():
+    for event in pygame.event.get():
+        if event.type == pygame.QUIT:
+            pygame.quit()
+            sys.exit()
+
+
+class GridView:
+
+    def __init__(self, env, surface, blockSize=BLOCK_SIZE, headless=False):
+        self.env = env
+        self.surface = surface
+        self.blockSize = blockSize
+        self.headless = headless
+        self.robot = pygame.image.load(ROBOT_IMAGE).convert_alpha()
+        self.font = pygame.font.SysFont("Arial", 20)
+        self._background = None
+
+    # Display size for env, cols x rows blocks as in the original scripts
+    @staticmethod
+    def windowSize(env, blockSize=BLOCK_SIZE):
+        return env.cols * blockSize, env.rows * blockSize
+
+    # Top-left pixel of the cell of a (row, col) state
+    def cellPosition(self, state):
+        return state[1] * (self.blockSize + MARGIN), state[0] * (self.blockSize + MARGIN)
+
+    def cellRect(self, state):
+        x, y = self.cellPosition(state)
+        return pygame.Rect(x, y, self.blockSize, self.blockSize)
+
+    def fillCell(self, surface, state, color):
+        pygame.draw.rect(surface, color, self.cellRect(state))
+
+    # Draws the static board (grid, obstacles red, water blue, goals green)
+    # onto surface
+    def renderBoard(self, surface):
+        surface.fill(BACKGROUND_COLOR)
+        for state in self.env.states:
+            self.fillCell(surface, state, CELL_COLOR)
+        for state in self.env.obstacles:
+            self.fillCell(surface, state, OBSTACLE_COLOR)
+        for state in self.env.water:
+            self.fillCell(surface, state, WATER_COLOR)
+        for state in self.env.goals:
+            self.fillCell(surface, state, GOAL_COLOR)
+
+    # The board pre-rendered once to an off-screen surface, which every later
+    # frame starts from or restores the agent's previous cell from
+    def background(self):
+        if self._background is None:
+            self._background = pygame.Surface(self.surface.get_size()).convert()
+            self.renderBoard(self._background)
+        return self._background
+
+    def drawBoard(self):
+        self.surface.blit(self.background(), (0, 0))
+
+    # Draws the agent in the cell of state and returns the area it covers
+    def drawAgent(self, state):
+        x, y = self.cellPosition(state)
+        rect = self.robot.get_rect(center=(x+self.blockSize//2, y+self.blockSize//2))
+        self.surface.blit(self.robot, rect)
+        return rect
+
+    # Draws text in the top-left corner and returns the area it covers
+    def drawLabel(self, text):
+        return self.surface.blit(self.font.render(text, True, TEXT_COLOR), (5, 5))
+
+    # Updates the window, only the rects when given, and waits waitMs
+    # milliseconds; headless there is nothing to show or wait for
+    def present(self, waitMs=0, rects=None):
+        if self.headless:
+            return
+        pygame.display.update(rects)
+        if waitMs:
+            pygame.time.wait(waitMs)
+
+    # Plays back one episode, one frame per visited (row, col) state, each
+    # shown for waitMs and captured by recorder when given. The first frame
+    # is drawn in full from the cached background; after that only the
+    # agent's previous area is restored from the background (and the label
+    # area restored and redrawn if they overlap) and only those areas and the
+    # new agent area are updated on screen.
+    def playEpisode(self, episode, states, waitMs=0, recorder=None):
+        label = self.episodeLabel(episode)
+        previous = None
+
+        for step, state in enumerate(states):
+            if not self.headless:
+                handleEvents()
+            previous = self.drawFrame(state, label, previous, waitMs)
+            if recorder is not None:
+                recorder.capture(self.surface, episode, step)
+
+        if recorder is not None:
+            recorder.endEpisode(episode)
+
+    def episodeLabel(self, episode):
+        label = self.font.render("Iteration: " + str(episode), True, TEXT_COLOR)
+        return label, label.get_rect(topleft=(5, 5))
+
+    # Draws the agent at state and shows the frame. previous is the agent
+    # area returned for the previous frame of the episode, None to draw the
+    # first frame in full.
+    def drawFrame(self, state, label, previous, waitMs=0):
+        text, labelRect = label
+        if previous is None:
+            self.drawBoard()
+            self.surface.blit(text, labelRect)
+            dirty = None
+        else:
+            self.surface.blit(self.background(), previous, previous)
+            dirty = [previous]
+            if previous.colliderect(labelRect):
+                # the antialiased label blends with what is under it, so it
+                # goes back over clean background rather than its own pixels
+                self.surface.blit(self.background(), labelRect, labelRect)
+                self.surface.blit(text, labelRect)
+                dirty.append(labelRect)
+
+        agentRect = self.drawAgent(state)
+        if dirty is not None:
+            dirty.append(agentRect)
+        self.present(waitMs, dirty)
+        return agentRect
+
+    # Plays back the episodes of a rollouts.TrajectoryLog (all, or the
+    # episode indices in episodes), showing every stride-th step and the last
+    # one. Headless, the episodes are rendered without waits, for recorder.
+    # In a window the playback is interactive (see PLAYBACK_KEYS).
+    def playback(self, log, episodes=None, stride=1, waitMs=0, recorder=None):
+        if episodes is None:
+            episodes = np.arange(len(log.returns))
+
+        if self.headless:
+            for episode in episodes:
+                self.playEpisode(int(episode), self.strideStates(log, episode, stride), 0, recorder)
+            return
+
+        controls = {"index": 0, "waitMs": waitMs, "stride": stride, "paused": False, "typed": "", "restart": False}
+        while 0 <= controls["index"] < len(episodes):
+            episode = int(episodes[controls["index"]])
+            states = self.strideStates(log, episode, controls["stride"])
+            label = self.episodeLabel(episode)
+            previous = None
+            step = 0
+            controls["restart"] = False
+
+            while step < len(states):
+                if self._playbackEvents(controls, episodes) == "quit":
+                    return
+                if controls["restart"]:
+                    break
+                if controls["paused"]:
+                    pygame.time.wait(PAUSE_MS)
+                    continue
+                previous = self.drawFrame(states[step], label, previous, controls["waitMs"])
+                if recorder is not None:
+                    recorder.capture(self.surface, episode, step)
+                step += 1
+
+            if recorder is not None:
+                recorder.endEpisode(episode)
+            if not controls["restart"]:
+                controls["index"] += 1
+
+    # (row, col) states of every stride-th step of an episode, ending with its last state
+    def strideStates(self, log, episode, stride):
+        states = rollouts.episodeStates(log, episode)
+        shown = states[::stride]
+        if len(states) and (len(states) - 1) % stride:
+            shown = np.append(shown, states[-1])
+        return [self.env.toState(int(state)) for state in shown]
+
+    # Applies the pending key presses of an interactive playback to controls;
+    # returns "quit" when playback should stop
+    def _playbackEvents(self, controls, episodes):
+        for event in pygame.event.get():
+            if event.type == pygame.QUIT:
+                pygame.quit()
+                sys.exit()
+            if event.type != pygame.KEYDOWN:
+                continue
+
+            if event.key in (pygame.K_ESCAPE, pygame.K_q):
+                return "quit"
+            elif event.key == pygame.K_SPACE:
+                controls["paused"] = not controls["paused"]
+            elif event.key == pygame.K_RIGHT:
+                controls["waitMs"] //= 2
+            elif event.key == pygame.K_LEFT:
+                controls["waitMs"] = max(1, controls["waitMs"] * 2)
+            elif event.key in (pygame.K_PLUS, pygame.K_EQUALS, pygame.K_KP_PLUS):
+                controls["stride"] *= 2
+            elif event.key in (pygame.K_MINUS, pygame.K_KP_MINUS):
+                controls["stride"] = max(1, controls["stride"] // 2)
+            elif event.key == pygame.K_n:
+                controls["index"] += 1
+                controls["restart"] = True
+            elif event.key == pygame.K_b:
+                controls["index"] = max(0, controls["index"] - 1)
+                controls["restart"] = True
+            elif event.unicode.isdigit():
+                controls["typed"] += event.unicode
+            elif event.key in (pygame.K_RETURN, pygame.K_KP_ENTER) and controls["typed"]:
+                # first selected episode at or after the typed episode number
+                controls["index"] = int(np.searchsorted(episodes, int(controls["typed"])))
+                controls["typed"] = ""
+                controls["restart"] = True
+        return None
+
+
+class FrameRecorder:
+
+    # format is "png" (episode-<n>-frame-<k>.png files, encoded FRAME_BATCH
+    # at a time) or "gif" (one episode-<n>.gif per episode, needs Pillow)
+    def __init__(self, directory, format="png", batchSize=FRAME_BATCH, frameMs=GIF_FRAME_MS):
+        if format not in EXPORT_FORMATS:
+            raise ValueError(f"unknown export format {format!r}, expected one of {EXPORT_FORMATS}")
+        if format == "gif" and Image is None:
+            raise ImportError("GIF export needs Pillow (pip install pillow)")
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.format = format
+        self.batchSize = batchSize
+        self.frameMs = frameMs
+        self.frames = [] # (episode, step, size, RGB bytes) not yet encoded
+        self.written = 0 # files written
+
+    def capture(self, surface, episode, step):
+        self.frames.append((episode, step, surface.get_size(), pygame.image.tobytes(surface, "RGB")))
+        if self.format == "png" and len(self.frames) >= self.batchSize:
+            self.flush()
+
+    def endEpisode(self, episode):
+        if self.format == "gif":
+            self.flush()
+
+    # Encodes the buffered frames
+    def flush(self):
+        if not self.frames:
+            return
+        if self.format == "png":
+            for episode, step, size, data in self.frames:
+                path = os.path.join(self.directory, f"episode-{episode:05d}-frame-{step:05d}.png")
+                pygame.image.save(pygame.image.frombytes(data, size, "RGB"), path)
+                self.written += 1
+        else:
+            images = [Image.frombytes("RGB", size, data) for _, _, size, data in self.frames]
+            path = os.path.join(self.directory, f"episode-{self.frames[0][0]:05d}.gif")
+            images[0].save(path, save_all=True, append_images=images[1:], duration=self.frameMs, loop=0)
+            self.written += 1
+        self.frames = []
+
+    def close(self):
+        self.flush()
+
+
+class HeatmapView:
+
+    # vmin/vmax are the values drawn fully red/green, by default the lowest
+    # and highest cell reward
+    def __init__(self, env, surface, cellSize, headless=False, vmin=None, vmax=None):
+        self.env = env
+        self.surface = surface
+        self.cellSize = cellSize
+        self.headless = headless
+        self.vmin = min(float(env.cellRewards.min()), -1e-9) if vmin is None else vmin
+        self.vmax = max(float(env.cellRewards.max()), 1e-9) if vmax is None else vmax
+        self.glyphs = arrowGlyphs(cellSize) if cellSize >= ARROW_MIN_CELL else None
+        self._rowIds = None
+        self._cells = pygame.Surface((env.cols, env.rows)) # one pixel per cell, scaled up when there are no arrows
+
+    # Cell size in pixels that fits env into a maxWindow square, at most blockSize
+    @staticmethod
+    def fitCellSize(env, maxWindow=HEATMAP_MAX_WINDOW, blockSize=BLOCK_SIZE):
+        return max(1, min(blockSize, maxWindow // max(env.rows, env.cols)))
+
+    @staticmethod
+    def windowSize(env, cellSize):
+        return env.cols * cellSize, env.rows * cellSize
+
+    # (rows, cols, 3) colours of flat values: white at 0, blending to red at
+    # vmin and to green at vmax, obstacles grey
+    def colors(self, values):
+        values = np.asarray(values, dtype=np.float64).reshape(self.env.rows, self.env.cols)
+        low = np.clip(values / self.vmin, 0, 1)[..., None]
+        high = np.clip(values / self.vmax, 0, 1)[..., None]
+        zero = np.array(ZERO_COLOR, dtype=np.float64)
+        colors = zero + low * (np.array(NEGATIVE_COLOR) - zero) + high * (np.array(POSITIVE_COLOR) - zero)
+        colors[self.env.isObstacle.reshape(values.shape)] = HEATMAP_OBSTACLE_COLOR
+        return colors.astype(np.uint8)
+
+    # True when cells are large enough to draw policy arrows in
+    def showsPolicy(self):
+        return self.glyphs is not None
+
+    # Draws values (flat, in state order) and, when given, an int8 policy
+    # as arrows, and shows the frame
+    def update(self, values, policy=None, caption=None):
+        rows, cols, size = self.env.rows, self.env.cols, self.cellSize
+        colors = self.colors(values)
+
+        # surfarray indexes pixels as (x, y)
+        if policy is not None and self.showsPolicy():
+            pixels = colors.repeat(size, axis=0).repeat(size, axis=1)
+            # glyph index len(ACTIONS) is the empty glyph of states without an action
+            glyphIndex = np.where(np.asarray(policy) < 0, len(gridworld.ACTIONS), policy).reshape(rows, cols)
+            mask = self.glyphs[glyphIndex].transpose(0, 2, 1, 3).reshape(rows * size, cols * size)
+            pixels[mask] = ARROW_COLOR
+            pygame.surfarray.blit_array(self.surface, pixels.transpose(1, 0, 2))
+        else:
+            pygame.surfarray.blit_array(self._cells, colors.transpose(1, 0, 2))
+            pygame.transform.scale(self._cells, self.surface.get_size(), self.surface)
+        if caption is not None:
+            pygame.display.set_caption(caption)
+        if not self.headless:
+            handleEvents()
+            pygame.display.update()
+
+    # Greedy int8 policy for flat values, -1 for terminal and obstacle states
+    def greedyPolicy(self, values, discount):
+        model = self.env.sparseModel()
+        if self._rowIds is None:
+            self._rowIds = np.repeat(np.arange(model.numStates * model.numActions), np.diff(model.indptr))
+        Q = solvers.sparseBackup(model, np.asarray(values, dtype=np.float64), discount, self._rowIds)
+        policy = np.argmax(Q, axis=1).astype(np.int8)
+        policy[~self.env.active] = -1
+        return policy
+
+
+# (len(ACTIONS) + 1, size, size) boolean masks of an arrow per action, in
+# ACTIONS order, and a final empty mask
+def arrowGlyphs(size):
+    y, x = np.mgrid[0:size, 0:size] + 0.5
+    center = size / 2
+    shaft = (np.abs(x - center) <= max(size * 0.06, 0.5)) & (y >= size * 0.35) & (y <= size * 0.8)
+    head = (y >= size * 0.2) & (y <= size * 0.5) & (np.abs(x - center) <= (y - size * 0.2) * 0.8)
+    up = shaft | head
+    rotations = {"U": 0, "L": 1, "D": 2, "R": 3} # counter-clockwise quarter turns of the up arrow
+    glyphs = [np.rot90(up, rotations[action]) for action in gridworld.ACTIONS]
+    return np.array(glyphs + [np.zeros((size, size), dtype=bool)])
+
+
+# Solver observer (see solvers.quietObserver()) that pushes V, and its greedy
+# policy when the cells fit arrows, to a HeatmapView. A frame is pushed at
+# most every interval seconds, and after a frame that took t seconds to
+# render the next one waits at least t / renderFraction, so rendering stays
+# under renderFraction of the solve time however large the grid is.
+def heatmapObserver(view, discount, interval=FRAME_INTERVAL, renderFraction=RENDER_FRACTION):
+    nextFrame = 0.0
+
+    def observer(iteration, delta, elapsed, V):
+        nonlocal nextFrame
+        start = time.perf_counter()
+        if start < nextFrame:
+            return
+        values = view.env.fromDicts(V, {})[0] if isinstance(V, dict) else V
+        policy = view.greedyPolicy(values, discount) if view.showsPolicy() else None
+        view.update(values, policy, f"Value iteration {iteration}, delta {delta:.4g}")
+        nextFrame = start + max(interval, (time.perf_counter() - start) / renderFraction)
+
+    return observer
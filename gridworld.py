@@ -0,0 +1,448 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import bisect
+import functools
+from collections import deque, namedtuple
+
+import numpy as np
+
+# Gridworld environment shared by the value iteration and uniform selection
+# scripts. A Gridworld takes the layout, rewards and slip probabilities and
+# compiles them into flat arrays at construction: a state (row, col) is stored
+# as the flat index row * cols + col, and actions are indexed in ACTIONS order.
+#
+# Environment dynamics (defaults, same as calculateValue):
+# 1. Probability of 0.8 the agent moves in the intended direction
+# 2. Probability of 0.05 it veers left (goLeft)
+# 3. Probability of 0.05 it veers right (goRight)
+# 4. Probability of 0.10 it does not move at all
+# 5. Moves that leave the grid or hit an obstacle leave the agent in place
+# 6. Episodes end in a goal or water cell
+
+ACTIONS = ['U', 'D', 'L', 'R']
+MOVES = ['U', 'D', 'L', 'R', 'stay'] # columns of the successor table
+
+MOVE_OFFSETS = {'U': (-1, 0), 'D': (1, 0), 'L': (0, -1), 'R': (0, 1), 'stay': (0, 0)}
+VEER_LEFT = {'U': 'L', 'D': 'R', 'R': 'U', 'L': 'D'}
+VEER_RIGHT = {'U': 'R', 'D': 'L', 'R': 'D', 'L': 'U'}
+
+# CSR-style transitions: row s * numActions + a holds the successors of taking
+# action a in state s in indices[indptr[row]:indptr[row+1]] with matching
+# probs, and rewards[row] is the reward added by that backup
+SparseModel = namedtuple("SparseModel", ["numStates", "numActions", "indptr", "indices", "probs", "rewards"])
+
+# K same-shaped gridworlds stacked for solvers.batchValueIteration():
+# nextStates[k, s, m], cellRewards[k, s] and active[k, s] are the arrays of
+# gridworld k and outcomeProbs[k, a, o] its slip probabilities, with the
+# outcome columns given by the shared outcomeMoves[a, o]
+GridworldBatch = namedtuple("GridworldBatch", ["rows", "cols", "nextStates", "cellRewards", "active", "outcomeMoves", "outcomeProbs"])
+
+# Precomputed lookups for the dict based code in the scripts:
+# rewards[state] is the reward table, steps[(state, move)] is the
+# (nextState, reward) pair takeAction returns, outcomes[(state, action)] lists
+# the (probability, nextState) pairs of calculateValue in order and skip holds
+# the terminal and obstacle states that are never backed up
+EnvironmentModel = namedtuple("EnvironmentModel", ["rewards", "steps", "outcomes", "terminal", "obstacles", "skip"])
+
+GOAL_REWARD = 10
+WATER_REWARD = -10
+OBSTACLE_REWARD = -1 # hitting an obstacle or attempting to leave the grid
+DEFAULT_REWARD = 0
+
+MODEL_CACHE_SIZE = 32
+
+INTENDED_PROB = 0.8
+VEER_LEFT_PROB = 0.05
+VEER_RIGHT_PROB = 0.05
+STAY_PROB = 0.10
+
+SWEEP_ORDERS = ["rowmajor", "reverse", "rows", "bfs"]
+
+
+class Gridworld:
+
+    # The defaults are the original 5x5 grid. goals, water and obstacles are
+    # sequences of (row, col) cells; an episode ends in any goal or water cell.
+    def __init__(self, rows=5, cols=5, start=(0, 0), goals=((4, 4),), water=((4, 2),), obstacles=((2, 2), (3, 2)),
+                 goalReward=GOAL_REWARD, waterReward=WATER_REWARD, obstacleReward=OBSTACLE_REWARD,
+                 defaultReward=DEFAULT_REWARD, intendedProb=INTENDED_PROB, veerLeftProb=VEER_LEFT_PROB,
+                 veerRightProb=VEER_RIGHT_PROB, stayProb=STAY_PROB):
+        self.rows = int(rows)
+        self.cols = int(cols)
+        self.start = tuple(start)
+        self.goals = tuple(tuple(cell) for cell in goals)
+        self.water = tuple(tuple(cell) for cell in water)
+        self.obstacles = tuple(tuple(cell) for cell in obstacles)
+        self.goalReward = goalReward
+        self.waterReward = waterReward
+        self.obstacleReward = obstacleReward
+        self.defaultReward = defaultReward
+        self.intendedProb = intendedProb
+        self.veerLeftProb = veerLeftProb
+        self.veerRightProb = veerRightProb
+        self.stayProb = stayProb
+
+        self._validate()
+        self._compile()
+        self._sparseModel = None
+        self._environmentModel = None
+
+    def __repr__(self):
+        return f"Gridworld({self.rows}x{self.cols}, goals={list(self.goals)}, water={list(self.water)}, {len(self.obstacles)} obstacles)"
+
+    def _validate(self):
+        if self.rows < 1 or self.cols < 1:
+            raise ValueError(f"grid must have at least one cell, got {self.rows}x{self.cols}")
+        for cell in (self.start,) + self.goals + self.water + self.obstacles:
+            if not self.inBounds(cell):
+                raise ValueError(f"cell {cell} is outside the {self.rows}x{self.cols} grid")
+        if not self.goals:
+            raise ValueError("at least one goal state is required")
+        if self.start in self.obstacles:
+            raise ValueError(f"start state {self.start} is an obstacle")
+        probs = [self.intendedProb, self.veerLeftProb, self.veerRightProb, self.stayProb]
+        if min(probs) < 0 or abs(sum(probs) - 1.0) > 1e-9:
+            raise ValueError(f"slip probabilities must be non-negative and sum to 1, got {probs}")
+
+    # Flat arrays every solver and simulator works from. Only the per-cell
+    # masks and rewards are built here; the per-state tables below (states,
+    # nextStates, blocked, stepRewards) are built on first use, so solvers that
+    # work from the masks alone, like the tiled one, never pay for them.
+    def _compile(self):
+        self.numStates = self.rows * self.cols
+        self.startIndex = self.toIndex(self.start)
+
+        self.isObstacle = np.zeros(self.numStates, dtype=bool)
+        self.isObstacle[[self.toIndex(cell) for cell in self.obstacles]] = True
+        self.isTerminal = np.zeros(self.numStates, dtype=bool)
+        self.isTerminal[[self.toIndex(cell) for cell in self.goals + self.water]] = True
+        self.active = ~(self.isTerminal | self.isObstacle) # states that get backed up
+
+        # reward of every cell; a goal wins over water, water over an obstacle
+        self.cellRewards = np.full(self.numStates, float(self.defaultReward))
+        self.cellRewards[self.isObstacle] = self.obstacleReward
+        self.cellRewards[[self.toIndex(cell) for cell in self.water]] = self.waterReward
+        self.cellRewards[[self.toIndex(cell) for cell in self.goals]] = self.goalReward
+
+    # (row, col) of every flat state id
+    @functools.cached_property
+    def states(self):
+        return [(i, j) for i in range(self.rows) for j in range(self.cols)]
+
+    # nextStates[s, m] is the flat index reached from s with move MOVES[m],
+    # blocked[s, m] is True when that move would leave the grid or hit an obstacle
+    @functools.cached_property
+    def _successors(self):
+        rows, cols = np.divmod(np.arange(self.numStates), self.cols)
+        nextStates = np.empty((self.numStates, len(MOVES)), dtype=np.int64)
+        blocked = np.empty((self.numStates, len(MOVES)), dtype=bool)
+        for m, move in enumerate(MOVES):
+            nextRows = rows + MOVE_OFFSETS[move][0]
+            nextCols = cols + MOVE_OFFSETS[move][1]
+            inside = (nextRows >= 0) & (nextRows < self.rows) & (nextCols >= 0) & (nextCols < self.cols)
+            target = np.where(inside, nextRows * self.cols + nextCols, 0)
+            blocked[:, m] = ~inside | self.isObstacle[target]
+            nextStates[:, m] = np.where(blocked[:, m], np.arange(self.numStates), target)
+        return nextStates, blocked
+
+    @property
+    def nextStates(self):
+        return self._successors[0]
+
+    @property
+    def blocked(self):
+        return self._successors[1]
+
+    # stepRewards[s, m] is the reward takeAction(s, MOVES[m]) returns
+    @functools.cached_property
+    def stepRewards(self):
+        return np.where(self.blocked, float(self.obstacleReward), self.cellRewards[self.nextStates])
+
+    # Hashable description of the configuration, equal for equal gridworlds
+    def key(self):
+        return (self.rows, self.cols, self.start, self.goals, self.water, self.obstacles,
+                self.goalReward, self.waterReward, self.obstacleReward, self.defaultReward,
+                self.intendedProb, self.veerLeftProb, self.veerRightProb, self.stayProb)
+
+    def toIndex(self, state):
+        return state[0] * self.cols + state[1]
+
+    def toState(self, index):
+        return divmod(int(index), self.cols)
+
+    def inBounds(self, state):
+        return 0 <= state[0] < self.rows and 0 <= state[1] < self.cols
+
+    # (move, probability) pairs an intended action can result in
+    def actionOutcomes(self, action):
+        return [
+            (action, self.intendedProb),
+            (VEER_LEFT[action], self.veerLeftProb),
+            (VEER_RIGHT[action], self.veerRightProb),
+            ('stay', self.stayProb),
+        ]
+
+    # Sampling form of actionOutcomes(): outcomeMoves[a, k] is the MOVES column
+    # executed for outcome k of ACTIONS[a] and outcomeProbs[a, k] its probability
+    def outcomeTable(self):
+        outcomeMoves = np.array([[MOVES.index(move) for move, _ in self.actionOutcomes(action)] for action in ACTIONS])
+        outcomeProbs = np.array([[prob for _, prob in self.actionOutcomes(action)] for action in ACTIONS])
+        return outcomeMoves, outcomeProbs
+
+    # One sampled step of the slip dynamics: the (next flat state, reward) of
+    # taking action index a in flat state s, with u a uniform draw in [0, 1)
+    # picking the outcome the same way rollouts.batchRollouts() does
+    def sampleStep(self, s, a, u):
+        moves, cdf = self._outcomeCdf
+        k = min(bisect.bisect_right(cdf[a], u), len(cdf[a]) - 1)
+        m = moves[a][k]
+        return int(self.nextStates[s, m]), float(self.stepRewards[s, m])
+
+    # outcomeTable() as lists, with cumulative probabilities, for sampleStep()
+    @functools.cached_property
+    def _outcomeCdf(self):
+        outcomeMoves, outcomeProbs = self.outcomeTable()
+        return outcomeMoves.tolist(), np.cumsum(outcomeProbs, axis=1).tolist()
+
+    # Step table for simulating episodes: nextStates[s, m] and stepRewards[s, m]
+    # are what takeAction(s, MOVES[m]) returns, and isTerminal marks the states
+    # where an episode ends. The first columns line up with ACTIONS, so a
+    # deterministic step is a lookup at the action index.
+    def stepTable(self):
+        return self.nextStates, self.stepRewards, self.isTerminal
+
+    # Dense P[a, s, s'] and R[a, s] arrays, O(actions * states^2) memory
+    def transitionTensor(self):
+        P = np.zeros((len(ACTIONS), self.numStates, self.numStates))
+        for a, action in enumerate(ACTIONS):
+            for move, prob in self.actionOutcomes(action):
+                np.add.at(P[a], (np.arange(self.numStates), self.nextStates[:, MOVES.index(move)]), prob)
+
+        # calculateValue adds the reward of the "stay" outcome, i.e. the reward
+        # of the current cell, on top of the discounted successor values
+        R = np.tile(self.cellRewards, (len(ACTIONS), 1))
+        return P, R
+
+    # SparseModel of the dynamics, built on first use. Every state-action pair
+    # has at most four successors and outcomes that land on the same cell are
+    # merged, so memory grows linearly with the number of cells.
+    def sparseModel(self):
+        if self._sparseModel is not None:
+            return self._sparseModel
+
+        numStates = self.numStates
+        numActions = len(ACTIONS)
+        rowList, colList, probList = [], [], []
+        for a, action in enumerate(ACTIONS):
+            for move, prob in self.actionOutcomes(action):
+                rowList.append(np.arange(numStates) * numActions + a)
+                colList.append(self.nextStates[:, MOVES.index(move)])
+                probList.append(np.full(numStates, prob))
+
+        # merge duplicate (row, successor) entries, sorted by row then successor
+        keys = np.concatenate(rowList) * numStates + np.concatenate(colList)
+        uniqueKeys, inverse = np.unique(keys, return_inverse=True)
+        probs = np.bincount(inverse, weights=np.concatenate(probList))
+        rows, indices = np.divmod(uniqueKeys, numStates)
+
+        indptr = np.zeros(numStates * numActions + 1, dtype=np.int64)
+        np.cumsum(np.bincount(rows, minlength=numStates * numActions), out=indptr[1:])
+
+        self._sparseModel = SparseModel(
+            numStates=numStates,
+            numActions=numActions,
+            indptr=indptr,
+            indices=indices.astype(np.int32 if numStates < 2**31 else np.int64),
+            probs=probs,
+            rewards=np.repeat(self.cellRewards, numActions),
+        )
+        return self._sparseModel
+
+    # EnvironmentModel lookups for the dict based scripts, built on first use
+    def environmentModel(self):
+        if self._environmentModel is not None:
+            return self._environmentModel
+
+        # rewards keep the type they were configured with (ints by default)
+        rewards = {}
+        goals, water, obstacles = set(self.goals), set(self.water), set(self.obstacles)
+        for state in self.states:
+            if state in goals:
+                rewards[state] = self.goalReward
+            elif state in water:
+                rewards[state] = self.waterReward
+            elif state in obstacles:
+                rewards[state] = self.obstacleReward
+            else:
+                rewards[state] = self.defaultReward
+
+        steps = {}
+        for s, state in enumerate(self.states):
+            for m, move in enumerate(MOVES):
+                if self.blocked[s, m]:
+                    steps[(state, move)] = (state, self.obstacleReward)
+                else:
+                    nextState = self.states[self.nextStates[s, m]]
+                    steps[(state, move)] = (nextState, rewards[nextState])
+
+        outcomes = {}
+        for state in self.states:
+            for action in ACTIONS:
+                outcomes[(state, action)] = [(prob, steps[(state, move)][0]) for move, prob in self.actionOutcomes(action)]
+
+        terminal = frozenset(self.goals + self.water)
+        obstacleSet = frozenset(self.obstacles)
+        self._environmentModel = EnvironmentModel(
+            rewards=rewards,
+            steps=steps,
+            outcomes=outcomes,
+            terminal=terminal,
+            obstacles=obstacleSet,
+            skip=terminal | obstacleSet,
+        )
+        return self._environmentModel
+
+    # (V, policy) dicts in the format of valueIteration() from flat value and
+    # action index arrays; terminal and obstacle states keep their rewards
+    # and get no policy entry
+    def toDicts(self, values, actions):
+        V = dict(self.environmentModel().rewards)
+        policy = {}
+        for index, state in enumerate(self.states):
+            if self.active[index]:
+                V[state] = float(values[index])
+                policy[state] = ACTIONS[actions[index]]
+        return V, policy
+
+    # Inverse of toDicts(): flat float64 values and int8 action indices, -1
+    # where the policy has no entry
+    def fromDicts(self, V, policy):
+        values = np.array([V[state] for state in self.states], dtype=np.float64)
+        return values, self.policyArray(policy)
+
+    # Policy dict of (row, col) -> 'U'/'D'/'L'/'R' as an int8 array of action
+    # indices by flat state id, -1 for states without an action
+    def policyArray(self, policy):
+        actions = np.full(self.numStates, -1, dtype=np.int8)
+        for state, action in policy.items():
+            actions[self.toIndex(state)] = ACTIONS.index(action)
+        return actions
+
+    # Printable label of every state for an int8 policy: the action letter,
+    # or O/W/G for obstacles, water and goals
+    def policyLabels(self, actions):
+        markers = {cell: "O" for cell in self.obstacles}
+        markers.update({cell: "W" for cell in self.water})
+        markers.update({cell: "G" for cell in self.goals})
+        return [ACTIONS[a] if a >= 0 else markers.get(state, " ") for state, a in zip(self.states, np.asarray(actions).tolist())]
+
+    # Deterministic transitions of a fixed int8 policy: nextIndex[s] and
+    # rewards[s] are the state and reward takeAction(s, policy action) returns.
+    # States without an action (-1) stay in place.
+    def policySteps(self, actions):
+        actions = np.asarray(actions)
+        columns = np.where(actions >= 0, actions, MOVES.index('stay'))
+        states = np.arange(self.numStates)
+        return self.nextStates[states, columns], self.stepRewards[states, columns]
+
+    # Breadth-first distance in moves from every state to the nearest goal,
+    # -1 for states that cannot reach one (walled off cells and obstacles)
+    def goalDistances(self):
+        moves = [MOVES.index(action) for action in ACTIONS]
+        distance = np.full(self.numStates, -1)
+        queue = deque()
+        for goal in self.goals:
+            distance[self.toIndex(goal)] = 0
+            queue.append(self.toIndex(goal))
+
+        # moves are symmetric, so successors are also the predecessors
+        while queue:
+            s = queue.popleft()
+            for m in moves:
+                neighbour = self.nextStates[s, m]
+                if not self.blocked[s, m] and distance[neighbour] < 0:
+                    distance[neighbour] = distance[s] + 1
+                    queue.append(neighbour)
+
+        return distance
+
+    # Sweep orderings for solvers.gaussSeidelValueIteration(), as a list of
+    # blocks of flat state indices:
+    #   rowmajor - one state at a time in states order
+    #   reverse  - one state at a time, bottom-right to top-left
+    #   rows     - one grid row at a time (Jacobi inside a row)
+    #   bfs      - reverse breadth-first layers starting from the goal states, so
+    #              values flow outward from the goals in one sweep. With several
+    #              goals one layer can hold neighbours (cells equally far from
+    #              two goals), so each layer is split by checkerboard colour
+    #              (row + col parity), which grid neighbours never share.
+    #              Unreachable cells come last, split the same way.
+    def sweepOrder(self, kind):
+        if kind == "rowmajor":
+            return [np.array([s]) for s in range(self.numStates)]
+        if kind == "reverse":
+            return [np.array([s]) for s in reversed(range(self.numStates))]
+        if kind == "rows":
+            return [np.arange(row * self.cols, (row + 1) * self.cols) for row in range(self.rows)]
+        if kind != "bfs":
+            raise ValueError(f"unknown sweep order {kind!r}, expected one of {SWEEP_ORDERS}")
+
+        distance = self.goalDistances()
+        layers = [np.flatnonzero(distance == d) for d in range(distance.max() + 1)]
+        layers.append(np.flatnonzero((distance < 0) & ~self.isObstacle)) # unreachable
+        color = np.add(*np.divmod(np.arange(self.numStates), self.cols)) % 2
+        return [half for layer in layers for half in (layer[color[layer] == 0], layer[color[layer] == 1]) if half.size]
+
+
+# Returns the Gridworld for a configuration (Gridworld keyword arguments),
+# compiling it on first use. Gridworlds are cached on the configuration, so
+# any change to the layout produces a new key and a freshly compiled grid.
+def getGridworld(**config):
+    return _compileGridworld(tuple(sorted((name, _freeze(value)) for name, value in config.items())))
+
+
+def _freeze(value):
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(item) for item in value)
+    return value
+
+
+@functools.lru_cache(maxsize=MODEL_CACHE_SIZE)
+def _compileGridworld(config):
+    return Gridworld(**dict(config))
+
+
+# Stacks gridworlds of the same rows x cols into a GridworldBatch
+def stackGridworlds(gridworlds):
+    gridworlds = list(gridworlds)
+    if not gridworlds:
+        raise ValueError("at least one gridworld is required")
+    rows, cols = gridworlds[0].rows, gridworlds[0].cols
+    for env in gridworlds:
+        if (env.rows, env.cols) != (rows, cols):
+            raise ValueError(f"gridworlds must share one shape, got {env.rows}x{env.cols} and {rows}x{cols}")
+
+    outcomeMoves, _ = gridworlds[0].outcomeTable()
+    return GridworldBatch(
+        rows=rows,
+        cols=cols,
+        nextStates=np.stack([env.nextStates for env in gridworlds]),
+        cellRewards=np.stack([env.cellRewards for env in gridworlds]),
+        active=np.stack([env.active for env in gridworlds]),
+        outcomeMoves=outcomeMoves,
+        outcomeProbs=np.stack([env.outcomeTable()[1] for env in gridworlds]),
+    )
+
+
+# Reverse transition index of a SparseModel: the states with some action that
+# can lead to state s are preds[predptr[s]:predptr[s+1]], including s itself
+# when it can stay in place
+def predecessorIndex(model):
+    rows = np.repeat(np.arange(model.numStates * model.numActions), np.diff(model.indptr))
+    keys = np.unique(model.indices.astype(np.int64) * model.numStates + rows // model.numActions)
+    successors, preds = np.divmod(keys, model.numStates)
+
+    predptr = np.zeros(model.numStates + 1, dtype=np.int64)
+    np.cumsum(np.bincount(successors, minlength=model.numStates), out=predptr[1:])
+    return predptr, preds
@@ -0,0 +1,191 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import cProfile
+import contextlib
+import datetime
+import json
+import os
+import pstats
+import signal
+import time
+from collections import Counter
+
+# Timers, counters and profiles for the solver and simulator hot paths.
+#
+# Instrumented code calls the module functions phase() and count(), which do
+# nothing but test ACTIVE while no Instrumentation is running, and are only
+# called once per sweep or episode, never per state or step, so the disabled
+# cost is a few hundred nanoseconds per sweep. Run a block under an
+# Instrumentation to collect:
+#   phases    wall seconds and calls per named phase (phases may nest)
+#   counters  event totals, e.g. backups, transitions, episodes, steps,
+#             cache hits and misses
+#   profile   optionally a cProfile dump (.prof, for pstats or snakeviz) or
+#             a sampling profile of collapsed stacks (.folded, for
+#             flamegraph.pl or speedscope) taken every sampleInterval
+#             seconds of CPU time
+# and export them with writeReport() as a JSON run report.
+
+PROFILERS = ["cprofile", "sampling"]
+SAMPLE_INTERVAL = 0.001 # seconds of CPU time between samples of the sampling profiler
+TOP_FUNCTIONS = 20 # profile entries listed in the report
+
+# The running Instrumentation, None while disabled
+ACTIVE = None
+
+_DISABLED = contextlib.nullcontext()
+
+
+class Instrumentation:
+
+    # profile is None, "cprofile" or "sampling"
+    def __init__(self, name="run", profile=None, sampleInterval=SAMPLE_INTERVAL):
+        if profile is not None and profile not in PROFILERS:
+            raise ValueError(f"unknown profiler {profile!r}, expected one of {PROFILERS}")
+        self.name = name
+        self.profile = profile
+        self.sampleInterval = sampleInterval
+        self.phases = {}
+        self.counters = Counter()
+        self.started = None
+        self.wallSeconds = 0.0
+        self._start = None
+        self._profiler = None
+
+    def start(self):
+        global ACTIVE
+        if ACTIVE is not None:
+            raise RuntimeError(f"instrumentation {ACTIVE.name!r} is already running")
+        self.started = datetime.datetime.now().isoformat(timespec="seconds")
+        self._start = time.perf_counter()
+        if self.profile == "cprofile":
+            self._profiler = cProfile.Profile()
+            self._profiler.enable()
+        elif self.profile == "sampling":
+            self._profiler = _StackSampler(self.sampleInterval)
+            self._profiler.start()
+        # only once the profiler runs, so a failed start leaves nothing active
+        ACTIVE = self
+        return self
+
+    def stop(self):
+        global ACTIVE
+        if self.profile == "cprofile":
+            self._profiler.disable()
+        elif self.profile == "sampling":
+            self._profiler.stop()
+        self.wallSeconds += time.perf_counter() - self._start
+        ACTIVE = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+        return False
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds, calls = self.phases.get(name, (0.0, 0))
+            self.phases[name] = (seconds + time.perf_counter() - start, calls + 1)
+
+    def count(self, name, n=1):
+        self.counters[name] += n
+
+    # Profile entries that took the most time: functions by cumulative time
+    # for cProfile, leaf functions by samples for the sampling profiler
+    def topFunctions(self, limit=TOP_FUNCTIONS):
+        if self.profile == "cprofile":
+            stats = pstats.Stats(self._profiler)
+            entries = sorted(stats.stats.items(), key=lambda item: item[1][3], reverse=True)[:limit]
+            return [{"function": f"{name} ({os.path.basename(filename)}:{line})", "calls": calls,
+                     "ownSeconds": ownTime, "cumulativeSeconds": cumulativeTime}
+                    for (filename, line, name), (_, calls, ownTime, cumulativeTime, _) in entries]
+        if self.profile == "sampling":
+            leaves = Counter()
+            for stack, samples in self._profiler.stacks.items():
+                leaves[stack.rsplit(";", 1)[-1]] += samples
+            total = sum(leaves.values()) or 1
+            return [{"function": function, "samples": samples, "fraction": samples / total}
+                    for function, samples in leaves.most_common(limit)]
+        return []
+
+    # Writes the profile to path: pstats data for cProfile, one
+    # "frame;frame;... samples" line per stack for the sampling profiler
+    def dumpProfile(self, path):
+        if self.profile == "cprofile":
+            self._profiler.dump_stats(path)
+        elif self.profile == "sampling":
+            with open(path, "w") as f:
+                for stack, samples in self._profiler.stacks.most_common():
+                    f.write(f"{stack} {samples}\n")
+        else:
+            raise ValueError("no profiler was running")
+
+    def report(self):
+        return {
+            "name": self.name,
+            "started": self.started,
+            "wallSeconds": self.wallSeconds,
+            "phases": {name: {"seconds": seconds, "calls": calls} for name, (seconds, calls) in self.phases.items()},
+            "counters": dict(self.counters),
+            "profile": None if self.profile is None else {"kind": self.profile, "top": self.topFunctions()},
+        }
+
+    # Writes the JSON report to path and, with a profiler, the profile next
+    # to it (path with .prof or .folded instead of .json)
+    def writeReport(self, path):
+        report = self.report()
+        if self.profile is not None:
+            profilePath = os.path.splitext(path)[0] + (".prof" if self.profile == "cprofile" else ".folded")
+            self.dumpProfile(profilePath)
+            report["profile"]["file"] = profilePath
+        with open(path, "w") as f:
+            json.dump(report, f, indent=2)
+        return report
+
+
+# Times the block as phase name of the running Instrumentation, if any
+def phase(name):
+    if ACTIVE is None:
+        return _DISABLED
+    return ACTIVE.phase(name)
+
+
+# Adds n to counter name of the running Instrumentation, if any
+def count(name, n=1):
+    if ACTIVE is not None:
+        ACTIVE.counters[name] += n
+
+
+# Sampling profiler: a SIGPROF interval timer interrupts the main thread every
+# interval seconds of CPU time and the handler records the interrupted stack
+class _StackSampler:
+
+    def __init__(self, interval):
+        if not hasattr(signal, "setitimer"):
+            raise ValueError("the sampling profiler needs signal.setitimer (Unix)")
+        self.interval = interval
+        self.stacks = Counter()
+        self._previous = None
+
+    def start(self):
+        self._previous = signal.signal(signal.SIGPROF, self._sample)
+        signal.setitimer(signal.ITIMER_PROF, self.interval, self.interval)
+
+    def stop(self):
+        signal.setitimer(signal.ITIMER_PROF, 0, 0)
+        signal.signal(signal.SIGPROF, self._previous or signal.SIG_DFL)
+
+    def _sample(self, signum, frame):
+        stack = []
+        while frame is not None:
+            code = frame.f_code
+            stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+            frame = frame.f_back
+        self.stacks[";".join(reversed(stack))] += 1
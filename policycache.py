@@ -0,0 +1,188 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import functools
+import hashlib
+import json
+import os
+import tempfile
+
+import numpy as np
+
+import instrumentation
+
+# Content-addressed on-disk cache of solved value functions and policies.
+# An entry is keyed by a hash of the gridworld configuration (layout, rewards
+# and slip probabilities), the discount, the threshold and the solver, and is
+# stored as three files in the cache directory:
+#   <key>.V.npy       flat float64 value function
+#   <key>.policy.npy  flat int8 action indices, -1 for terminal/obstacle states
+#   <key>.json        metadata: the hashed parameters plus size and sha256 of
+#                     both arrays, written last so it marks a complete entry
+# The hash also covers the source of SOLVER_SOURCES and of the cache's own
+# sources (the calling script, whose dict based valueIteration() is not in
+# the shared modules), so editing any code that produces a solution
+# invalidates its entries without a version bump.
+# Arrays are loaded memory-mapped, read-only, and returned as they are. An
+# entry whose metadata does not match the requested parameters or whose arrays fail the size/checksum test is treated
+# as stale or corrupt, removed, and reported as a miss. The cache is bounded
+# to maxBytes; the least recently used entries (by metadata mtime, refreshed
+# on every hit) are evicted first.
+
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".policy-cache")
+CACHE_VERSION = 1 # bump when the stored format changes
+SOLVER_SOURCES = ["gridworld.py", "solvers.py", "valuestore.py"] # modules whose source is hashed into every key
+MAX_CACHE_BYTES = 256 * 1024 * 1024
+
+
+class PolicyCache:
+
+    # sources are further source files hashed into every key, e.g. the
+    # calling script's __file__
+    def __init__(self, directory=CACHE_DIR, maxBytes=MAX_CACHE_BYTES, verify=True, sources=()):
+        self.directory = directory
+        self.maxBytes = maxBytes
+        self.verify = verify # checksum the arrays on every load
+        self.sources = tuple(os.path.abspath(path) for path in sources)
+
+    # Hashed parameters of an entry
+    def parameters(self, env, discount, threshold, method):
+        here = os.path.dirname(os.path.abspath(__file__))
+        return {
+            "version": CACHE_VERSION,
+            "solverSource": sourceDigest(tuple(os.path.join(here, name) for name in SOLVER_SOURCES) + self.sources),
+            "gridworld": json.loads(json.dumps(env.key())), # tuples as lists, as stored in the metadata
+            "discount": float(discount),
+            "threshold": float(threshold),
+            "method": method,
+        }
+
+    @staticmethod
+    def key(parameters):
+        return hashlib.sha256(json.dumps(parameters, sort_keys=True).encode()).hexdigest()
+
+    def _path(self, key, suffix):
+        return os.path.join(self.directory, key + suffix)
+
+    # Returns (V, policy) memory-mapped for the parameters, or None on a miss
+    def load(self, env, discount, threshold, method):
+        parameters = self.parameters(env, discount, threshold, method)
+        key = self.key(parameters)
+        metaPath = self._path(key, ".json")
+        if not os.path.exists(metaPath):
+            instrumentation.count("policyCache.misses")
+            return None
+
+        try:
+            with open(metaPath) as f:
+                meta = json.load(f)
+            if meta["parameters"] != parameters:
+                raise ValueError("stale entry")
+
+            arrays = []
+            for name in ("V", "policy"):
+                path = self._path(key, f".{name}.npy")
+                if os.path.getsize(path) != meta[name]["bytes"]:
+                    raise ValueError(f"{name} has the wrong size")
+                if self.verify and _checksum(path) != meta[name]["sha256"]:
+                    raise ValueError(f"{name} checksum mismatch")
+                arrays.append(np.load(path, mmap_mode="r"))
+
+            V, policy = arrays
+            if V.shape != (env.numStates,) or policy.shape != (env.numStates,):
+                raise ValueError("wrong shape")
+        except (OSError, ValueError, KeyError):
+            self.remove(key)
+            instrumentation.count("policyCache.misses")
+            instrumentation.count("policyCache.invalid")
+            return None
+
+        os.utime(metaPath) # mark as recently used
+        instrumentation.count("policyCache.hits")
+        return V, policy
+
+    # Bytes of the array files of an entry for numStates states
+    @staticmethod
+    def entryBytes(numStates):
+        return numStates * (np.dtype(np.float64).itemsize + np.dtype(np.int8).itemsize)
+
+    # Stores V and policy (flat arrays in env.states order) for the parameters
+    # and returns the key. A solution larger than maxBytes, which eviction
+    # would drop straight away, is not stored and None is returned.
+    def store(self, env, discount, threshold, method, V, policy):
+        if self.entryBytes(env.numStates) > self.maxBytes:
+            return None
+        parameters = self.parameters(env, discount, threshold, method)
+        key = self.key(parameters)
+        os.makedirs(self.directory, exist_ok=True)
+
+        meta = {"parameters": parameters}
+        arrays = {"V": np.asarray(V, dtype=np.float64), "policy": np.asarray(policy, dtype=np.int8)}
+        for name, array in arrays.items():
+            path = self._path(key, f".{name}.npy")
+            _atomicWrite(path, lambda f: np.save(f, array))
+            meta[name] = {"bytes": os.path.getsize(path), "sha256": _checksum(path)}
+
+        _atomicWrite(self._path(key, ".json"), lambda f: f.write(json.dumps(meta, sort_keys=True).encode()))
+        self.evict()
+        return key
+
+    def remove(self, key):
+        for suffix in (".json", ".V.npy", ".policy.npy"):
+            try:
+                os.remove(self._path(key, suffix))
+            except FileNotFoundError:
+                pass
+
+    # Evicts least recently used entries until the cache fits in maxBytes
+    def evict(self):
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.endswith(".json"):
+                key = name[:-len(".json")]
+                size = sum(os.path.getsize(self._path(key, suffix))
+                           for suffix in (".json", ".V.npy", ".policy.npy") if os.path.exists(self._path(key, suffix)))
+                entries.append((os.path.getmtime(self._path(key, ".json")), size, key))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, key in sorted(entries):
+            if total <= self.maxBytes:
+                break
+            self.remove(key)
+            total -= size
+
+    def clear(self):
+        if os.path.isdir(self.directory):
+            for name in os.listdir(self.directory):
+                os.remove(os.path.join(self.directory, name))
+
+
+# sha256 of the contents of the files at paths, read once per process
+@functools.lru_cache(maxsize=None)
+def sourceDigest(paths):
+    digest = hashlib.sha256()
+    for path in paths:
+        with open(path, "rb") as f:
+            digest.update(f.read())
+    return digest.hexdigest()
+
+
+def _checksum(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+# Writes through a temporary file in the same directory and renames it into
+# place, so readers never see a partially written file
+def _atomicWrite(path, write):
+    fd, tmpPath = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            write(f)
+        os.replace(tmpPath, path)
+    except BaseException:
+        os.remove(tmpPath)
+        raise
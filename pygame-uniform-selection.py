@@ -4,88 +4,69 @@ import numpy as np
 import random
 import math
 
+import gridview
+import gridworld
+import rollouts
+
 # globals
-GRID_ROWS = 5
-GRID_COLS = 5
-START_STATE = (0, 0)
-GOAL_STATE = (4, 4)
-OBSTACLES = [(2,2),(3,2)]
-WATER_STATE = (4,2)
-ALL_STATES = [(i,j) for i in range(GRID_COLS) for j in range(GRID_ROWS)]
-DRAW_STATES = {}
+GRID_CONFIG = {
+    "rows": 5,
+    "cols": 5,
+    "start": (0, 0),
+    "goals": [(4, 4)],
+    "water": [(4,2)],
+    "obstacles": [(2,2),(3,2)],
+}
+ACTION_MOVES = {"up": "U", "down": "D", "left": "L", "right": "R"}
 
 DISCOUNT_FACTOR = 0.9
 MAX_EPISODES = 10
 EPISODE_SPEED = 100 # milliseconds, must be integer
+SEED = None # seed for the bulk simulation, None for fresh entropy
 
 # pygame setup
-WINDOW_WIDTH = 500
-WINDOW_HEIGHT = 500
 BLOCK_SIZE = 100
-WINDOW = pygame.display.set_mode((WINDOW_WIDTH, WINDOW_HEIGHT))
-WINDOW.fill((0,0,0))
-pygame.display.set_caption("Gridworld")
-ROBOT = pygame.image.load("robot.png").convert_alpha()
+HEADLESS = False # render off-screen with SDL's dummy video driver, without EPISODE_SPEED waits
+EXPORT = None # write rendered episodes to EXPORT_DIR as "png" frames or one "gif" per episode (needs Pillow)
+EXPORT_DIR = "frames"
+EXPORT_EPISODES = 10 # episodes rendered when HEADLESS (with EXPORT), the rest are only simulated
+PLAYBACK = True # simulate all episodes in bulk, then replay them (keys in gridview.PLAYBACK_KEYS)
+PLAYBACK_FILTER = None # replay only episodes that ended in "water", the "goal" or were "truncated", None for all
+PLAYBACK_START = 0 # first episode replayed
+PLAYBACK_STRIDE = 1 # replay every k-th step of each episode
+MAX_EPISODE_STEPS = None # step limit of the bulk simulation, None for none
 
 
 # ---- PYGAME FUNCTIONS ----
 
-def drawGrid():
-    margin = 1
-    color = (255,255,255)
-    states = [(i,j) for i in range(GRID_COLS) for j in range(GRID_ROWS)]
-
-    i = 0
-    for column in range(0, WINDOW_WIDTH+1, BLOCK_SIZE+margin):
-        for row in range(0, WINDOW_HEIGHT+1, BLOCK_SIZE+margin):
-            pygame.draw.rect(WINDOW, color, [row, column, BLOCK_SIZE, BLOCK_SIZE])
-            DRAW_STATES[states[i]] = (row,column) # map state cord with pixel cord for drawing
-            i += 1
-
-
-# Takes list of obstacle cords and draws those cells red
-def drawObstacles(obstacles_list):
-    color = (255,0,0) # red
-
-    # draw red obstacles
-    for obstacleCord in obstacles_list:
-        x = DRAW_STATES[obstacleCord][0]
-        y = DRAW_STATES[obstacleCord][1]
-        pygame.draw.rect(WINDOW, color, [x, y, BLOCK_SIZE, BLOCK_SIZE])
-
-    # draw blue water state
-    pygame.draw.rect(WINDOW, (30,144,255), [DRAW_STATES[WATER_STATE][0], DRAW_STATES[WATER_STATE][1], BLOCK_SIZE, BLOCK_SIZE])
+# Episodes are always simulated; they are drawn in the window, or when
+# HEADLESS only the first EXPORT_EPISODES and only to export them
+def renderEpisode(episode):
+    if HEADLESS:
+        return EXPORT is not None and episode < EXPORT_EPISODES
+    return True
 
 
-# Draws the goal cord green
-def drawGoal(goalCord):
-    color = (124,252,0) # green
-    x = DRAW_STATES[goalCord][0]
-    y = DRAW_STATES[goalCord][1]
-    pygame.draw.rect(WINDOW, color, [x, y, BLOCK_SIZE, BLOCK_SIZE])
+# Episodes of a rollouts.TrajectoryLog to replay: those PLAYBACK_FILTER
+# selects from PLAYBACK_START on, and when HEADLESS the first EXPORT_EPISODES
+# of them, only to export them
+def playbackEpisodes(log):
+    episodes = gridview.selectEpisodes(environment(), log, PLAYBACK_FILTER, PLAYBACK_START)
+    if HEADLESS:
+        return episodes[:EXPORT_EPISODES] if EXPORT is not None else episodes[:0]
+    return episodes
 
 
-# Draws agent on the window at cord
-def drawAgent(cord):
-    x = DRAW_STATES[cord][0]
-    y = DRAW_STATES[cord][1]
-    WINDOW.blit(ROBOT, ROBOT.get_rect(center=(x+50, y+50)))
-
+# ---- GRIDWORLD FUNCTIONS ----
 
-# Displays iteration text
-def displayIteration(i, font):
-    counter_text = font.render("Iteration: " + str(i), True, (0, 0, 0))
-    WINDOW.blit(counter_text, (5, 5))
+# Gridworld compiled from GRID_CONFIG, built once and reused until GRID_CONFIG changes
+def environment():
+    return gridworld.getGridworld(**GRID_CONFIG)
 
 
-# ---- GRIDWORLD FUNCTIONS ----
-
 def isValidState(stateCord):
-    if (stateCord[0] >= 0) and (stateCord[0] <= (GRID_ROWS-1)):
-        if (stateCord[1] >= 0) and (stateCord[1] <= (GRID_COLS-1)):
-            if stateCord not in OBSTACLES:
-                return True
-    return False # obstacle or outside grid
+    env = environment()
+    return env.inBounds(stateCord) and stateCord not in env.obstacles # obstacle or outside grid
 
 
 def getActionSpace():
@@ -94,90 +75,46 @@ def getActionSpace():
         
 
 def initRewardFunction():
-    goalReward = 10
-    waterReward = -10
-    obstacleReward = -1
-    defaultReward = 0
-    rewards = {}
-
-    for state in ALL_STATES:
-        if state == GOAL_STATE:
-            rewards[state] = goalReward
-        elif state == WATER_STATE:
-            rewards[state] = waterReward
-        elif state in OBSTACLES:
-            rewards[state] = obstacleReward
-        else:
-            rewards[state] = defaultReward
-
-    return rewards
+    return dict(environment().environmentModel().rewards)
 
 
 # move agent up, down, left, or right given current state cord
 # returns next state cord, and reward from the action taken
-def makeAction(currStateCord, action):
-    reward = 0 # default
-
-    if action == "up":
-        nextStateCord = (currStateCord[0]-1, currStateCord[1])
-    elif action == "down":
-        nextStateCord = (currStateCord[0]+1, currStateCord[1])
-    elif action == "left":
-        nextStateCord = (currStateCord[0], currStateCord[1]-1)
-    elif action == "right":
-        nextStateCord = (currStateCord[0], currStateCord[1]+1)
-    else:
+# (the reward of the cell entered, or the obstacle reward when the move
+# leaves the grid or hits an obstacle and the agent stays put)
+def makeAction(currStateCord, action, model=None):
+    if action not in ACTION_MOVES:
         return currStateCord, 0 # return 0 reward for invalid actions
 
-    # make sure nextStateCord is within board boundaries AND not an obstacle
-    if isValidState(nextStateCord):
-        if nextStateCord == GOAL_STATE:
-            reward = 10
-            return nextStateCord, reward
-        elif nextStateCord == WATER_STATE:
-            reward = -10
-            return nextStateCord, reward
-        else:
-            # give default
-            return nextStateCord, reward
-    else:
-        # hit obstacle/attempt to leave grid
-        reward = -1
-        return currStateCord, reward
+    if model is None:
+        model = environment().environmentModel()
 
+    return model.steps[(currStateCord, ACTION_MOVES[action])]
 
-def visualUniformRandomSelection():
+
+# Each episode is simulated at full speed, recording the visited states only
+# when it is rendered, and then played back on view (a gridview.GridView),
+# with its frames captured by recorder when given.
+def visualUniformRandomSelection(view=None, recorder=None):
+    env = environment()
+    model = env.environmentModel()
     discountedReturns = []
-    font = pygame.font.SysFont("Arial", 20)
+    waitMs = 0 if HEADLESS else EPISODE_SPEED
 
     for episode in range(MAX_EPISODES):
-        currState = START_STATE
+        currState = env.start
         discountedReturn = 0
         timestep = 0
+        trajectory = [] if view is not None and renderEpisode(episode) else None
 
-        while currState != GOAL_STATE:
-            # allow exit from pygame window
-            for event in pygame.event.get():
-                if event.type == pygame.QUIT:
-                    pygame.quit()
-                    sys.exit()
-            
-            # for display
-            drawGrid()
-            drawObstacles(OBSTACLES)
-            drawGoal(GOAL_STATE)
-            displayIteration(episode, font)
-            
+        while currState not in env.goals:
             # np.random uniformly distributes probablity between choices
             action = np.random.choice(getActionSpace())
 
             # get next state and the reward for the action
-            nextState, reward = makeAction(currState, action)
-
-            # draw agent at next state, update display
-            drawAgent(nextState)
-            pygame.display.update()
-            pygame.time.wait(EPISODE_SPEED)
+            nextState, reward = makeAction(currState, action, model)
+            if trajectory is not None:
+                trajectory.append(nextState)
 
             # calculate discounted return
             discountedReturn += reward * (DISCOUNT_FACTOR ** timestep)
@@ -187,19 +124,43 @@ def visualUniformRandomSelection():
             currState = nextState
 
             # if agent gets stuck in water, go to next episode
-            if currState == WATER_STATE:
+            if currState in env.water:
                 break
 
         # add the episodes final discounted return
         discountedReturns.append(discountedReturn)
 
+        # for display
+        if trajectory is not None:
+            view.playEpisode(episode, trajectory, waitMs, recorder)
+
     return discountedReturns
 
 
-def main():
-    pygame.init()
+# All MAX_EPISODES episodes simulated in lockstep, with one batched action
+# draw per step, and recorded as a rollouts.TrajectoryLog for playback
+def simulateEpisodes():
+    env = environment()
+    nextStates, stepRewards, isTerminal = env.stepTable()
+    return rollouts.recordRollouts(nextStates, stepRewards, isTerminal, env.startIndex, MAX_EPISODES,
+                                   DISCOUNT_FACTOR, rng=np.random.default_rng(SEED), maxSteps=MAX_EPISODE_STEPS)
+
 
-    returns = visualUniformRandomSelection()
+def main():
+    env = environment()
+    surface = gridview.openDisplay(gridview.GridView.windowSize(env, BLOCK_SIZE), HEADLESS)
+    view = gridview.GridView(env, surface, BLOCK_SIZE, HEADLESS)
+    recorder = gridview.FrameRecorder(EXPORT_DIR, EXPORT) if EXPORT is not None else None
+
+    if PLAYBACK:
+        log = simulateEpisodes()
+        returns = log.returns
+        view.playback(log, playbackEpisodes(log), PLAYBACK_STRIDE, 0 if HEADLESS else EPISODE_SPEED, recorder)
+    else:
+        returns = visualUniformRandomSelection(view, recorder)
+    if recorder is not None:
+        recorder.close()
+        print(f"Wrote {recorder.written} {EXPORT} files to {EXPORT_DIR}")
     
     mean_return = np.mean(returns)
     std_return = np.std(returns)
@@ -2,11 +2,18 @@
 # -*- coding: utf-8 -*-
 
 import sys
+import time
 import numpy as np
 import random
 import math
 import pygame
 
+import gridview
+import gridworld
+import policycache
+import rollouts
+import solvers
+
 # Value iteration implementation for Gridworld with following environment dynamics:
 # 1. Probability of 0.8 the agent moves in a specified direction.
 # 2. Probability of 0.05 it gets confused and veers to the right (i.e. -90deg from where it attempted to move)
@@ -14,8 +21,9 @@ import pygame
 # 4. Probability of 0.10 the agent temporarily breaks and does not move at all
 # 5. If dynamics would cause the agent to EXIT (leave grid boundary) or hit OBSTACLE then the agent does not move
 # 6. Start in STATE = (0,0) and the process ends when STATE = (4,4)
+# The layout lives in GRID_CONFIG (keyword arguments of gridworld.Gridworld).
 
-# Grid structure:
+# Default grid structure:
 # (0,0) (0,1) (0,2) (0,3) (0,4)
 # (1,0) (1,1) (1,2) (1,3) (1,4)
 # (2,0) (2,1) (2,2) (2,3) (2,4)
@@ -28,130 +36,79 @@ import pygame
 # -10 for water state
 # -1 for hitting obstacle/attempt to leave grid
 
-GRID_SIZE = 5
-GRID_COLS = 5
-GRID_ROWS = 5
-START_STATE = (0,0)
-GOAL_STATE = (4,4)
-WATER_STATE = (4,2)
-OBSTACLES = [(2,2),(3,2)]
-TERMINAL_STATES = [WATER_STATE, GOAL_STATE]
-STATES = [(i,j) for i in range(GRID_SIZE) for j in range(GRID_SIZE)]
+GRID_CONFIG = {
+    "rows": 5,
+    "cols": 5,
+    "start": (0,0),
+    "goals": [(4,4)],
+    "water": [(4,2)],
+    "obstacles": [(2,2),(3,2)],
+}
 ACTIONS = ['U', 'D', 'L', 'R'] # up, down, left, right, no action
 
 DISCOUNT_FACTOR = 0.9
 THRESHOLD = 0.0001
 MAX_EPISODES = 10000
+CACHE = True # reuse solutions this script stored in the on-disk policy cache (policycache.CACHE_DIR)
 
 # pygame setup
-WINDOW_WIDTH = 500
-WINDOW_HEIGHT = 500
 BLOCK_SIZE = 100
-WINDOW = pygame.display.set_mode((WINDOW_WIDTH, WINDOW_HEIGHT))
-WINDOW.fill((0,0,0))
-pygame.display.set_caption("Gridworld")
-ROBOT = pygame.image.load("robot.png").convert_alpha()
-DRAW_STATES = {}
 EPISODE_SPEED = 100 # milliseconds, must be integer
+HEADLESS = False # render off-screen with SDL's dummy video driver, without EPISODE_SPEED waits
+EXPORT = None # write rendered episodes to EXPORT_DIR as "png" frames or one "gif" per episode (needs Pillow)
+EXPORT_DIR = "frames"
+EXPORT_EPISODES = 10 # episodes rendered when HEADLESS (with EXPORT), the rest are only simulated
+PLAYBACK = True # simulate all episodes in bulk, then replay them (keys in gridview.PLAYBACK_KEYS)
+PLAYBACK_FILTER = None # replay only episodes that ended in "water", the "goal" or were "truncated", None for all
+PLAYBACK_START = 0 # first episode replayed
+PLAYBACK_STRIDE = 1 # replay every k-th step of each episode
+MAX_EPISODE_STEPS = None # step limit of the bulk simulation, None for none
+HEATMAP = False # draw V and its greedy policy live as value iteration converges (never loads a cached solution)
+HEATMAP_HOLD_MS = 2000 # milliseconds the converged heatmap stays up before playback, not when HEADLESS
 
 
 # ---- PYGAME FUNCTIONS ----
 
-def drawGrid():
-    margin = 1
-    color = (255,255,255)
-    states = [(i,j) for i in range(GRID_COLS) for j in range(GRID_ROWS)]
-
-    i = 0
-    for column in range(0, WINDOW_WIDTH+1, BLOCK_SIZE+margin):
-        for row in range(0, WINDOW_HEIGHT+1, BLOCK_SIZE+margin):
-            pygame.draw.rect(WINDOW, color, [row, column, BLOCK_SIZE, BLOCK_SIZE])
-            DRAW_STATES[states[i]] = (row,column) # map state cord with pixel cord for drawing
-            i += 1
-
-
-# Takes list of obstacle cords and draws those cells red
-def drawObstacles(obstacles_list):
-    color = (255,0,0) # red
-
-    # draw red obstacles
-    for obstacleCord in obstacles_list:
-        x = DRAW_STATES[obstacleCord][0]
-        y = DRAW_STATES[obstacleCord][1]
-        pygame.draw.rect(WINDOW, color, [x, y, BLOCK_SIZE, BLOCK_SIZE])
-
-    # draw blue water state
-    pygame.draw.rect(WINDOW, (30,144,255), [DRAW_STATES[WATER_STATE][0], DRAW_STATES[WATER_STATE][1], BLOCK_SIZE, BLOCK_SIZE])
+# Episodes are always simulated; they are drawn in the window, or when
+# HEADLESS only the first EXPORT_EPISODES and only to export them
+def renderEpisode(episode):
+    if HEADLESS:
+        return EXPORT is not None and episode < EXPORT_EPISODES
+    return True
 
 
-# Draws the goal cord green
-def drawGoal(goalCord):
-    color = (124,252,0) # green
-    x = DRAW_STATES[goalCord][0]
-    y = DRAW_STATES[goalCord][1]
-    pygame.draw.rect(WINDOW, color, [x, y, BLOCK_SIZE, BLOCK_SIZE])
+# Episodes of a rollouts.TrajectoryLog to replay: those PLAYBACK_FILTER
+# selects from PLAYBACK_START on, and when HEADLESS the first EXPORT_EPISODES
+# of them, only to export them
+def playbackEpisodes(log):
+    episodes = gridview.selectEpisodes(environment(), log, PLAYBACK_FILTER, PLAYBACK_START)
+    if HEADLESS:
+        return episodes[:EXPORT_EPISODES] if EXPORT is not None else episodes[:0]
+    return episodes
 
 
-# Draws agent on the window at cord
-def drawAgent(cord):
-    x = DRAW_STATES[cord][0]
-    y = DRAW_STATES[cord][1]
-    WINDOW.blit(ROBOT, ROBOT.get_rect(center=(x+50, y+50)))
-
-
-# Displays iteration text
-def displayIteration(i, font):
-    counter_text = font.render("Iteration: " + str(i), True, (0, 0, 0))
-    WINDOW.blit(counter_text, (5, 5))
+# --- GRIDWORLD FUNCTIONS ---
 
+# Gridworld compiled from GRID_CONFIG, built once and reused until GRID_CONFIG changes
+def environment():
+    return gridworld.getGridworld(**GRID_CONFIG)
 
-# --- GRIDWORLD FUNCTIONS ---
 
 def inBounds(state):
-    if (state[0] >= 0) and (state[0] <= (GRID_SIZE-1)):
-        if (state[1] >= 0) and (state[1] <= (GRID_SIZE-1)):
-            return True
-    return False
+    return environment().inBounds(state)
 
 
 def rewardFunction():
-    rewards = {}
-    goalReward = 10
-    waterReward = -10
-    obstacleReward = -1
-    defaultReward = 0
-
-    for state in STATES:
-        if state == GOAL_STATE:
-            rewards[state] = goalReward
-        elif state == WATER_STATE:
-            rewards[state] = waterReward
-        elif state in OBSTACLES:
-            rewards[state] = obstacleReward
-        else:
-            rewards[state] = defaultReward
-
-    return rewards
-
+    return dict(environment().environmentModel().rewards)
 
-def takeAction(state, action):
-    R = rewardFunction()
 
-    if action == "U":
-        nextState = (state[0]-1, state[1])
-    elif action == "D":
-        nextState = (state[0]+1, state[1])
-    elif action == "L":
-        nextState = (state[0], state[1]-1)
-    elif action == "R":
-        nextState = (state[0], state[1]+1)
-    elif action == "N": # stay still
-        nextState = (state)
+def takeAction(state, action, model=None):
+    if action == "N": # stay still
+        action = "stay"
+    if model is None:
+        model = environment().environmentModel()
 
-    if not inBounds(nextState) or nextState in OBSTACLES:
-        return state, -1
-    
-    return nextState, R[nextState]
+    return model.steps[(state, action)]
 
 
 def goLeft(intendedAction):
@@ -175,36 +132,40 @@ def goRight(intendedAction):
         return 'U'
 
 
-def calculateValue(V, state, action):
+def calculateValue(V, state, action, model=None):
+    if model is None:
+        model = environment().environmentModel()
 
-    newStateIntended, reward = takeAction(state, action)
-    newStateVeerLeft, reward = takeAction(state, goLeft(action))
-    newStateVeerRight, reward = takeAction(state, goRight(action))
-    stayState, reward = takeAction(state, "N")
-
-    v = reward
-    v += 0.8 * (DISCOUNT_FACTOR * V[newStateIntended]) # take intended action
-    v += 0.05 * (DISCOUNT_FACTOR * V[newStateVeerLeft]) # veer left
-    v += 0.05 * (DISCOUNT_FACTOR * V[newStateVeerRight]) # veer right
-    v += 0.10 * (DISCOUNT_FACTOR * V[stayState]) # stay still
+    # outcomes are intended action, veer left, veer right, stay still
+    v = model.steps[(state, "stay")][1]
+    for prob, nextState in model.outcomes[(state, action)]:
+        v += prob * (DISCOUNT_FACTOR * V[nextState])
 
     return v
 
 
-def valueIteration():
+# observer(iteration, delta, elapsed, V) is called after every sweep (see
+# solvers.quietObserver()); by default it prints V
+def valueIteration(observer=None):
+    env = environment()
+    if observer is None:
+        observer = solvers.fullDumpObserver(env.cols)
+    model = env.environmentModel()
+    skip = model.skip
     V = rewardFunction() # initialize V to reward function
     policy = {}
 
     iteration = 0
     converged = False
+    start = time.perf_counter()
 
     while not converged:
         delta = 0
         newV = rewardFunction()
 
-        for state in STATES:
-            if state not in TERMINAL_STATES + OBSTACLES:
-                actionValues = [calculateValue(V, state, action) for action in ACTIONS]
+        for state in env.states:
+            if state not in skip:
+                actionValues = [calculateValue(V, state, action, model) for action in ACTIONS]
                 newV[state] = round(max(actionValues), 4)
                 bestAction = ACTIONS[np.argmax(actionValues)]
                 policy[state] = bestAction
@@ -212,9 +173,7 @@ def valueIteration():
 
         V = newV
         
-        print(f"VI iteration {iteration}:")
-        visualizeV(V)
-        print()
+        observer(iteration, delta, time.perf_counter() - start, V)
 
         if delta < THRESHOLD:
             converged = True
@@ -226,12 +185,16 @@ def valueIteration():
     return V, policy
 
 
-def visualizeV(V):
+# values is a flat array by state id; terminal and obstacle states print
+# their configured reward, as in the V dict of valueIteration()
+def visualizeV(values):
+    env = environment()
+    rewards = env.environmentModel().rewards
     i = 0
     row = []
-    for v in V.values():
-        row.append(round(v, 2))
-        if i == GRID_SIZE-1:
+    for state, v, active in zip(env.states, np.asarray(values).tolist(), env.active.tolist()):
+        row.append(round(v, 2) if active else rewards[state])
+        if i == env.cols-1:
             print(row)
             row = []
             i = 0
@@ -239,20 +202,18 @@ def visualizeV(V):
             i += 1
 
 
+# policy is an int8 action array by flat state id (Gridworld.policyArray())
 def visualizePolicy(policy):
-    bestActions = list(policy.values())
+    env = environment()
 
-    # insert - for obstacles/terminal states
-    bestActions.insert(12, "O")
-    bestActions.insert(17, "O")
-    bestActions.insert(22, "W")
-    bestActions.insert(24, "G")
+    # action letters, with markers for obstacles/terminal states
+    bestActions = env.policyLabels(policy)
 
     i = 0
     row = []
     for bestAction in bestActions:
         row.append(bestAction)
-        if i == GRID_SIZE-1:
+        if i == env.cols-1:
             print(row)
             row = []
             i = 0
@@ -260,37 +221,27 @@ def visualizePolicy(policy):
             i += 1
 
 
-def runOptimalPolicy(policy):
+# policy is an int8 action array by flat state id (Gridworld.policyArray()).
+# Each episode is simulated at full speed, recording the visited states only
+# when it is rendered, and then played back on view (a gridview.GridView),
+# with its frames captured by recorder when given.
+def runOptimalPolicy(policy, view=None, recorder=None):
+    env = environment()
+    nextIndex, stepRewards = env.policySteps(policy)
+    nextIndex, stepRewards, isTerminal = nextIndex.tolist(), stepRewards.tolist(), env.isTerminal.tolist()
     discountedReturns = []
-    font = pygame.font.SysFont("Arial", 20)
+    waitMs = 0 if HEADLESS else EPISODE_SPEED
 
     for episode in range(MAX_EPISODES):
-        currState = START_STATE
+        currState = env.startIndex
         discountedReturn = 0
         timestep = 0
+        trajectory = [] if view is not None and renderEpisode(episode) else None
 
-        while currState != GOAL_STATE:
-            # allow exit from pygame window
-            for event in pygame.event.get():
-                if event.type == pygame.QUIT:
-                    pygame.quit()
-                    sys.exit()
-            
-            # for display
-            drawGrid()
-            drawObstacles(OBSTACLES)
-            drawGoal(GOAL_STATE)
-            displayIteration(episode, font)
-
-            # choose optimal action from policy
-            action = policy[currState]
-
-            # get next state and the reward for the action
-            nextState, reward = takeAction(currState, action)
-
-            drawAgent(nextState)
-            pygame.display.update()
-            pygame.time.wait(EPISODE_SPEED)
+        # episode ends in the goal or in water
+        while not isTerminal[currState]:
+            # get next state and the reward for the policy's action
+            nextState, reward = nextIndex[currState], stepRewards[currState]
 
             # calculate discounted return
             discountedReturn += reward * (DISCOUNT_FACTOR ** timestep)
@@ -298,31 +249,96 @@ def runOptimalPolicy(policy):
 
             # update current state to next state
             currState = nextState
-
-            # if agent in water, go to next episode
-            if currState == WATER_STATE:
-                break
+            if trajectory is not None:
+                trajectory.append(currState)
 
         # add the episodes final discounted return
         discountedReturns.append(discountedReturn)
 
+        # for display
+        if trajectory is not None:
+            view.playEpisode(episode, [env.toState(state) for state in trajectory], waitMs, recorder)
+
     return discountedReturns
 
 
+# All MAX_EPISODES episodes of the policy simulated in lockstep and
+# recorded as a rollouts.TrajectoryLog for playback
+def simulateEpisodes(policy):
+    env = environment()
+    nextStates, stepRewards, isTerminal = env.stepTable()
+    return rollouts.recordRollouts(nextStates, stepRewards, isTerminal, env.startIndex, MAX_EPISODES,
+                                   DISCOUNT_FACTOR, policy=np.asarray(policy), maxSteps=MAX_EPISODE_STEPS)
+
+
+# valueIteration(), or the cached solution an earlier run of this script
+# stored for the same layout, DISCOUNT_FACTOR and THRESHOLD. The key hashes
+# this file, so editing valueIteration() here invalidates those entries.
+# Returns the flat values and the policy as an int8 action array, read-only
+# memory-mapped when cached. With an observer (see valueIteration()) it
+# always solves, so the observer sees every sweep, and only stores the
+# solution.
+def solve(observer=None):
+    env = environment()
+    cache = policycache.PolicyCache(sources=[__file__]) if CACHE else None
+
+    if cache is not None and observer is None:
+        cached = cache.load(env, DISCOUNT_FACTOR, THRESHOLD, "python")
+        if cached is not None:
+            print(f"Loaded cached solution from {cache.directory}")
+            return cached
+
+    values, policy = env.fromDicts(*valueIteration(observer))
+
+    if cache is not None:
+        cache.store(env, DISCOUNT_FACTOR, THRESHOLD, "python", values, policy)
+
+    return values, policy
+
+
+# Solves with a live gridview.HeatmapView of the values, which stays up with
+# the converged values and policy for HEATMAP_HOLD_MS
+def solveWithHeatmap():
+    env = environment()
+    cellSize = gridview.HeatmapView.fitCellSize(env)
+    surface = gridview.openDisplay(gridview.HeatmapView.windowSize(env, cellSize), HEADLESS, "Value iteration")
+    heatmap = gridview.HeatmapView(env, surface, cellSize, HEADLESS)
+
+    values, policy = solve(gridview.heatmapObserver(heatmap, DISCOUNT_FACTOR))
+    heatmap.update(values, policy, "Value iteration converged")
+    if not HEADLESS:
+        pygame.time.wait(HEATMAP_HOLD_MS)
+    return values, policy
+
+
 def main():
-    pygame.init()
+    env = environment()
+    values, policy = solveWithHeatmap() if HEATMAP else (None, None)
+
+    surface = gridview.openDisplay(gridview.GridView.windowSize(env, BLOCK_SIZE), HEADLESS)
+    view = gridview.GridView(env, surface, BLOCK_SIZE, HEADLESS)
+    recorder = gridview.FrameRecorder(EXPORT_DIR, EXPORT) if EXPORT is not None else None
 
-    V, policy = valueIteration()
+    if not HEATMAP:
+        values, policy = solve()
 
     print()
     print("Optimal Value Function")
-    visualizeV(V)
+    visualizeV(values)
 
     print()
     print("Optimal Policy")   
     visualizePolicy(policy)
 
-    returns = runOptimalPolicy(policy)
+    if PLAYBACK:
+        log = simulateEpisodes(policy)
+        returns = log.returns
+        view.playback(log, playbackEpisodes(log), PLAYBACK_STRIDE, 0 if HEADLESS else EPISODE_SPEED, recorder)
+    else:
+        returns = runOptimalPolicy(policy, view, recorder)
+    if recorder is not None:
+        recorder.close()
+        print(f"Wrote {recorder.written} {EXPORT} files to {EXPORT_DIR}")
 
     mean_return = np.mean(returns)
     std_return = np.std(returns)
@@ -0,0 +1,149 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import math
+from statistics import NormalDist
+
+import numpy as np
+
+# Constant memory summary of discounted returns. Episodes are fed in one at a
+# time (add) or in batches (update) and two accumulators can be merged, which
+# is how the sharded simulator combines its workers.
+
+HISTOGRAM_BINS = 200
+
+
+class ReturnStatistics:
+
+    # histogramRange=(low, high) additionally keeps a fixed-bin histogram,
+    # with one underflow and one overflow bin, used for quantile estimates
+    def __init__(self, histogramRange=None, bins=HISTOGRAM_BINS):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0 # sum of squared deviations from the mean
+        self.min = math.inf
+        self.max = -math.inf
+
+        self.histogramRange = None
+        self.histogram = None
+        if histogramRange is not None:
+            self.histogramRange = (float(histogramRange[0]), float(histogramRange[1]))
+            self.histogram = np.zeros(bins + 2, dtype=np.int64)
+
+    # Welford update with a single return
+    def add(self, value):
+        value = float(value)
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+
+        if self.histogram is not None:
+            self.histogram[self._binIndex(np.array([value]))[0]] += 1
+
+    # Adds a batch of returns
+    def update(self, values):
+        values = np.asarray(values, dtype=float).ravel()
+        if values.size == 0:
+            return self
+
+        batch = ReturnStatistics()
+        batch.count = values.size
+        batch.mean = float(np.mean(values))
+        batch.m2 = float(np.sum((values - batch.mean) ** 2))
+        batch.min = float(np.min(values))
+        batch.max = float(np.max(values))
+        self._combine(batch)
+
+        if self.histogram is not None:
+            self.histogram += np.bincount(self._binIndex(values), minlength=self.histogram.size)
+        return self
+
+    # Folds another accumulator into this one (Chan et al. parallel combine)
+    def merge(self, other):
+        self._combine(other)
+        if self.histogram is not None and other.histogram is not None:
+            if self.histogramRange != other.histogramRange or self.histogram.size != other.histogram.size:
+                raise ValueError("cannot merge histograms with different bins")
+            self.histogram += other.histogram
+        return self
+
+    def _combine(self, other):
+        count = self.count + other.count
+        if other.count == 0:
+            return
+        delta = other.mean - self.mean
+        self.mean += delta * other.count / count
+        self.m2 += other.m2 + delta * delta * self.count * other.count / count
+        self.count = count
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+    def _binIndex(self, values):
+        low, high = self.histogramRange
+        bins = self.histogram.size - 2
+        index = np.floor((values - low) / (high - low) * bins).astype(np.int64) + 1
+        return np.clip(index, 0, bins + 1)
+
+    # population standard deviation, same as np.std(returns)
+    @property
+    def std(self):
+        if self.count == 0:
+            return 0.0
+        return math.sqrt(self.m2 / self.count)
+
+    def standardError(self):
+        if self.count < 2:
+            return math.inf
+        return math.sqrt(self.m2 / (self.count - 1) / self.count)
+
+    # Normal approximation confidence interval on the mean return
+    def confidenceInterval(self, level=0.95):
+        halfWidth = NormalDist().inv_cdf(0.5 + level / 2) * self.standardError()
+        return self.mean - halfWidth, self.mean + halfWidth
+
+    # True once the confidence interval on the mean is narrower than tolerance.
+    # Always False for tolerance=None, which means "use the whole budget".
+    def converged(self, tolerance, level=0.95):
+        if tolerance is None or self.count < 2:
+            return False
+        low, high = self.confidenceInterval(level)
+        return high - low < tolerance
+
+    # Quantile estimated from the histogram, interpolating inside a bin
+    def quantile(self, q):
+        if self.histogram is None:
+            raise ValueError("quantiles need a histogramRange")
+        if self.count == 0:
+            return math.nan
+
+        low, high = self.histogramRange
+        bins = self.histogram.size - 2
+        width = (high - low) / bins
+        target = q * self.count
+        cumulative = np.cumsum(self.histogram)
+        index = int(min(np.searchsorted(cumulative, target), bins + 1))
+
+        if index == 0:
+            return self.min
+        if index == bins + 1:
+            return self.max
+
+        before = cumulative[index - 1]
+        fraction = (target - before) / self.histogram[index] if self.histogram[index] else 0.0
+        return min(max(low + (index - 1 + fraction) * width, self.min), self.max)
+
+    # The numbers main() prints, plus the confidence interval on the mean
+    def summary(self, level=0.95):
+        ciLow, ciHigh = self.confidenceInterval(level)
+        return {
+            "count": self.count,
+            "mean": self.mean,
+            "std": self.std,
+            "max": self.max,
+            "min": self.min,
+            "ciLow": ciLow,
+            "ciHigh": ciHigh,
+        }
@@ -0,0 +1,226 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+from collections import deque, namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import gridworld
+import sharedarrays
+from returnstats import ReturnStatistics
+
+BATCH_SIZE = 100000 # episodes simulated at once by streamRollouts()
+EARLY_STOP_BATCH = 1000 # episodes between convergence checks when a tolerance is set
+SHARD_SIZE = 10000 # episodes per shard in parallelRollouts()
+
+# Recorded episodes in compact form: the flat state ids visited by all
+# episodes, start states included, concatenated in episode order, so that
+# episode i is states[offsets[i]:offsets[i+1]], and each episode's
+# discounted return
+TrajectoryLog = namedtuple("TrajectoryLog", ["states", "offsets", "returns"])
+
+# Batched Monte Carlo rollouts over the step table from
+# Gridworld.stepTable(). All episodes advance in lockstep as arrays of
+# states, discount factors and accumulated returns; episodes that reach a
+# terminal state are dropped from the working set.
+
+
+# Simulates numEpisodes episodes from startIndex and returns the discounted
+# return of each one. With policy=None actions are drawn uniformly at random
+# from rng, otherwise policy[s] is the action index taken in state s.
+# outcomes=(outcomeMoves, outcomeProbs) from Gridworld.outcomeTable() samples
+# the slip/stay dynamics the planner uses, with one batched draw per step;
+# without it every action moves exactly as intended.
+# maxSteps caps the episode length for policies that never terminate.
+# counters, when given, is a dict whose "steps" entry is increased by the
+# number of simulated steps. trace, when given, is a list that gets the
+# (episode indices, next states) of the episodes still running every step.
+def batchRollouts(nextStates, stepRewards, isTerminal, startIndex, numEpisodes, discount,
+                  policy=None, rng=None, maxSteps=None, outcomes=None, counters=None, trace=None):
+    if rng is None:
+        rng = np.random.default_rng()
+    numActions = len(gridworld.ACTIONS)
+
+    if outcomes is not None:
+        outcomeMoves, outcomeProbs = outcomes
+        outcomeCdf = np.cumsum(outcomeProbs, axis=1)
+        lastOutcome = outcomeMoves.shape[1] - 1
+
+    states = np.full(numEpisodes, startIndex, dtype=np.int64)
+    returns = np.zeros(numEpisodes)
+    discounts = np.ones(numEpisodes)
+
+    # indices of the episodes still running
+    running = np.arange(numEpisodes) if not isTerminal[startIndex] else np.arange(0)
+    timestep = 0
+
+    while running.size > 0 and (maxSteps is None or timestep < maxSteps):
+        currStates = states[running]
+        if counters is not None:
+            counters["steps"] = counters.get("steps", 0) + running.size
+
+        if policy is None:
+            actions = rng.integers(0, numActions, size=running.size)
+        else:
+            actions = policy[currStates]
+
+        if outcomes is None:
+            moves = actions
+        else:
+            draws = rng.random(running.size)
+            outcome = np.minimum((draws[:, None] >= outcomeCdf[actions]).sum(axis=1), lastOutcome)
+            moves = outcomeMoves[actions, outcome]
+
+        nextState = nextStates[currStates, moves]
+        returns[running] += discounts[running] * stepRewards[currStates, moves]
+        discounts[running] *= discount
+        states[running] = nextState
+        if trace is not None:
+            trace.append((running, nextState))
+
+        running = running[~isTerminal[nextState]]
+        timestep += 1
+
+    return returns
+
+
+# Simulates numEpisodes episodes like batchRollouts() and records them as a
+# TrajectoryLog, with states stored as dtype
+def recordRollouts(nextStates, stepRewards, isTerminal, startIndex, numEpisodes, discount,
+                   policy=None, rng=None, maxSteps=None, outcomes=None, dtype=np.int32):
+    trace = [(np.arange(numEpisodes), np.full(numEpisodes, startIndex))]
+    returns = batchRollouts(nextStates, stepRewards, isTerminal, startIndex, numEpisodes, discount,
+                            policy=policy, rng=rng, maxSteps=maxSteps, outcomes=outcomes, trace=trace)
+
+    # steps were traced in time order; a stable sort by episode keeps that
+    # order within each episode
+    episodes = np.concatenate([episode for episode, _ in trace])
+    visited = np.concatenate([state for _, state in trace]).astype(dtype)
+    states = visited[np.argsort(episodes, kind="stable")]
+    offsets = np.zeros(numEpisodes + 1, dtype=np.int64)
+    np.cumsum(np.bincount(episodes, minlength=numEpisodes), out=offsets[1:])
+    return TrajectoryLog(states, offsets, returns)
+
+
+# States of episode i of a TrajectoryLog
+def episodeStates(log, i):
+    return log.states[log.offsets[i]:log.offsets[i + 1]]
+
+
+# Last state of every episode of a TrajectoryLog
+def finalStates(log):
+    return log.states[log.offsets[1:] - 1]
+
+
+# Feeds numEpisodes episodes into a returnstats.ReturnStatistics, simulating
+# batchSize of them at a time so memory stays bounded however many episodes
+# are requested. Takes the same options as batchRollouts().
+# With a tolerance, numEpisodes becomes a budget: simulation stops after the
+# first batch where the level confidence interval on the mean return is
+# narrower than tolerance, and stats.count tells how many episodes were used.
+def streamRollouts(nextStates, stepRewards, isTerminal, startIndex, numEpisodes, discount,
+                   policy=None, rng=None, maxSteps=None, outcomes=None, batchSize=None, stats=None,
+                   tolerance=None, level=0.95, counters=None):
+    if rng is None:
+        rng = np.random.default_rng()
+    if stats is None:
+        stats = ReturnStatistics()
+    if batchSize is None:
+        batchSize = BATCH_SIZE if tolerance is None else EARLY_STOP_BATCH
+
+    done = 0
+    while done < numEpisodes:
+        batch = min(batchSize, numEpisodes - done)
+        stats.update(batchRollouts(nextStates, stepRewards, isTerminal, startIndex, batch, discount,
+                                   policy=policy, rng=rng, maxSteps=maxSteps, outcomes=outcomes,
+                                   counters=counters))
+        done += batch
+
+        if stats.converged(tolerance, level):
+            break
+
+    return stats
+
+
+def _runShard(task):
+    numEpisodes, seed, startIndex, discount, maxSteps, histogramRange = task
+    arrays = sharedarrays.WORKER_ARRAYS
+    outcomes = None
+    if "outcomeMoves" in arrays:
+        outcomes = (arrays["outcomeMoves"], arrays["outcomeProbs"])
+
+    counters = {"steps": 0}
+    returns = batchRollouts(arrays["nextStates"], arrays["stepRewards"], arrays["isTerminal"], startIndex,
+                            numEpisodes, discount, policy=arrays.get("policy"), rng=np.random.default_rng(seed),
+                            maxSteps=maxSteps, outcomes=outcomes, counters=counters)
+    return ReturnStatistics(histogramRange).update(returns), counters["steps"]
+
+
+# batchRollouts() split into shards of shardSize episodes and fanned out over
+# a process pool. Each shard draws from its own child of SeedSequence(seed)
+# and the per-shard statistics are merged in shard order, so the result does
+# not depend on the number of workers. The step table and policy live in
+# shared memory that every worker attaches to once. Returns a ReturnStatistics.
+# tolerance and level work as in streamRollouts(), checked after every shard;
+# shards already running past the stopping point are discarded.
+# counters works as in batchRollouts(), counting the steps of merged shards.
+def parallelRollouts(nextStates, stepRewards, isTerminal, startIndex, numEpisodes, discount,
+                     policy=None, seed=None, maxSteps=None, outcomes=None, workers=None, shardSize=None,
+                     histogramRange=None, tolerance=None, level=0.95, counters=None):
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if shardSize is None:
+        shardSize = SHARD_SIZE if tolerance is None else EARLY_STOP_BATCH
+
+    arrays = {"nextStates": nextStates, "stepRewards": stepRewards, "isTerminal": isTerminal}
+    if policy is not None:
+        arrays["policy"] = policy
+    if outcomes is not None:
+        arrays["outcomeMoves"], arrays["outcomeProbs"] = outcomes
+
+    numShards = max(1, -(-numEpisodes // shardSize))
+    seeds = np.random.SeedSequence(seed).spawn(numShards)
+    tasks = []
+    for shard in range(numShards):
+        shardEpisodes = min(shardSize, numEpisodes - shard * shardSize)
+        tasks.append((shardEpisodes, seeds[shard], startIndex, discount, maxSteps, histogramRange))
+
+    stats = ReturnStatistics(histogramRange)
+    steps = 0
+
+    def merge(result):
+        nonlocal steps
+        stats.merge(result[0])
+        steps += result[1]
+
+    blocks, specs = sharedarrays.shareArrays(arrays)
+    try:
+        if workers == 1:
+            sharedarrays.attachArrays(specs)
+            for task in tasks:
+                merge(_runShard(task))
+                if stats.converged(tolerance, level):
+                    break
+        else:
+            with ProcessPoolExecutor(max_workers=workers, initializer=sharedarrays.attachArrays, initargs=(specs,)) as pool:
+                # keep a bounded window of shards in flight and merge them in order
+                pending = deque()
+                nextTask = 0
+                while pending or nextTask < len(tasks):
+                    while nextTask < len(tasks) and len(pending) < 2 * workers:
+                        pending.append(pool.submit(_runShard, tasks[nextTask]))
+                        nextTask += 1
+
+                    merge(pending.popleft().result())
+                    if stats.converged(tolerance, level):
+                        for future in pending:
+                            future.cancel()
+                        break
+    finally:
+        sharedarrays.releaseArrays(blocks)
+
+    if counters is not None:
+        counters["steps"] = counters.get("steps", 0) + steps
+    return stats
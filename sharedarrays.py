@@ -0,0 +1,61 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from multiprocessing import shared_memory
+
+import numpy as np
+
+# numpy arrays in multiprocessing shared memory for process pool workers.
+# The parent copies its arrays into shared blocks with shareArrays() and passes
+# the returned specs to the pool initializer attachArrays(), which maps them
+# into WORKER_ARRAYS once per worker. Workers then read and write the same
+# memory as the parent without pickling any array data.
+
+# Arrays shared with pool workers, attached once per worker by attachArrays()
+WORKER_ARRAYS = {}
+_WORKER_BLOCKS = []
+
+
+# Copies each named array into a new shared memory block. Returns the blocks,
+# which the parent must pass to releaseArrays() when done, and the specs for
+# attachArrays().
+def shareArrays(arrays):
+    blocks = []
+    specs = {}
+    for name, array in arrays.items():
+        array = np.ascontiguousarray(array)
+        block = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+        np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf)[...] = array
+        blocks.append(block)
+        specs[name] = (block.name, array.shape, array.dtype.str)
+    return blocks, specs
+
+
+# Views of the blocks described by specs in this process, as a dict
+def openArrays(specs):
+    arrays = {}
+    for name, (blockName, shape, dtype) in specs.items():
+        block = shared_memory.SharedMemory(name=blockName)
+        _WORKER_BLOCKS.append(block)
+        arrays[name] = np.ndarray(shape, dtype=dtype, buffer=block.buf)
+    return arrays
+
+
+# Pool initializer: maps the shared blocks into WORKER_ARRAYS
+def attachArrays(specs):
+    WORKER_ARRAYS.clear()
+    WORKER_ARRAYS.update(openArrays(specs))
+
+
+def detachArrays():
+    WORKER_ARRAYS.clear()
+    while _WORKER_BLOCKS:
+        _WORKER_BLOCKS.pop().close()
+
+
+# Detaches this process and frees the blocks created by shareArrays()
+def releaseArrays(blocks):
+    detachArrays()
+    for block in blocks:
+        block.close()
+        block.unlink()
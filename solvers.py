@@ -0,0 +1,688 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import heapq
+import os
+import time
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import gridworld
+import sharedarrays
+
+# scipy is optional, exact policy evaluation falls back to a dense solve
+try:
+    from scipy import sparse as scipySparse
+    from scipy.sparse import linalg as scipyLinalg
+except ImportError:
+    scipySparse = None
+
+TILE_ROWS = 256 # grid rows per tile in tiledValueIteration()
+
+# Array based planners for the gridworld compiled in gridworld.py.
+# Every solver returns (V, policy, iterations) where V is a flat value
+# array, policy holds the index of the best action for each state and
+# iterations follows the same counting as valueIteration().
+#
+# Solvers take an optional observer, called as
+# observer(iteration, delta, elapsed, V) after every sweep; see
+# quietObserver(), summaryObserver() and fullDumpObserver() below.
+
+
+# Progress observer that prints nothing, for batch jobs
+def quietObserver(iteration, delta, elapsed, V):
+    pass
+
+
+# Progress observer printing one line every `every` iterations
+def summaryObserver(every=10, label="VI"):
+    def observer(iteration, delta, elapsed, V):
+        if iteration % every == 0:
+            print(f"{label} iteration {iteration}: delta {delta:.6f}, {elapsed:.3f} seconds")
+    return observer
+
+
+# Progress observer printing the whole value function every iteration, in the
+# same row format as visualizeV(). V may be a flat array or a dict in row-major state order.
+def fullDumpObserver(cols, label="VI"):
+    def observer(iteration, delta, elapsed, V):
+        values = list(V.values()) if isinstance(V, dict) else np.asarray(V).tolist()
+        print(f"{label} iteration {iteration}:")
+        for start in range(0, len(values), cols):
+            print([round(v, 2) for v in values[start:start + cols]])
+        print()
+    return observer
+
+
+# Value iteration over a dense transition tensor P[a, s, s'] and rewards R[a, s].
+# Each sweep is a single batched backup of every state and action; only the
+# states in the active mask are updated, everything else keeps its V0 value.
+def denseValueIteration(P, R, V0, active, discount, threshold, decimals=4, observer=None):
+    V = np.array(V0, dtype=float)
+    iteration = 0
+    start = time.perf_counter()
+
+    while True:
+        Q = R + discount * (P @ V) # (actions, states)
+
+        newV = V.copy()
+        newV[active] = Q.max(axis=0)[active]
+        if decimals is not None:
+            newV[active] = np.round(newV[active], decimals)
+
+        delta = np.max(np.abs(newV - V)[active], initial=0.0)
+        V = newV
+
+        if observer is not None:
+            observer(iteration, delta, time.perf_counter() - start, V)
+
+        if delta < threshold:
+            break
+
+        iteration += 1
+
+    policy = np.argmax(Q, axis=0)
+    return V, policy, iteration
+
+
+# Q[s, a] for every state and action of a gridworld.SparseModel
+def sparseBackup(model, V, discount, rowIds=None):
+    if rowIds is None:
+        rowIds = np.repeat(np.arange(model.numStates * model.numActions), np.diff(model.indptr))
+    expected = np.bincount(rowIds, weights=model.probs * V[model.indices], minlength=model.numStates * model.numActions)
+    return (model.rewards + discount * expected).reshape(model.numStates, model.numActions)
+
+
+# Value iteration run directly on a gridworld.SparseModel, same update rule
+# and stopping test as denseValueIteration(). maxIterations, when set, stops
+# after that many sweeps even if delta is still above threshold.
+def sparseValueIteration(model, V0, active, discount, threshold, decimals=4, observer=None, maxIterations=None):
+    V = np.array(V0, dtype=float)
+    rowIds = np.repeat(np.arange(model.numStates * model.numActions), np.diff(model.indptr))
+    iteration = 0
+    start = time.perf_counter()
+
+    while True:
+        Q = sparseBackup(model, V, discount, rowIds)
+
+        newV = V.copy()
+        newV[active] = Q.max(axis=1)[active]
+        if decimals is not None:
+            newV[active] = np.round(newV[active], decimals)
+
+        delta = np.max(np.abs(newV - V)[active], initial=0.0)
+        V = newV
+
+        if observer is not None:
+            observer(iteration, delta, time.perf_counter() - start, V)
+
+        if delta < threshold or (maxIterations is not None and iteration + 1 >= maxIterations):
+            break
+
+        iteration += 1
+
+    policy = np.argmax(Q, axis=1)
+    return V, policy, iteration
+
+
+# Value iteration over a gridworld.GridworldBatch, backing up all K gridworlds
+# in one vectorized operation per sweep. Each gridworld converges on its own:
+# once its delta drops below threshold its row of V is frozen and it leaves
+# the working set. Returns (V, policy, iterations) with V and policy of shape
+# (K, S) and iterations[k] counted as in valueIteration(). The observer gets
+# the largest delta of the gridworlds still running and the whole (K, S) V.
+def batchValueIteration(batch, discount, threshold, decimals=4, observer=None):
+    numGrids, numStates = batch.cellRewards.shape
+
+    # flat index into V.ravel() of every (grid, state, action, outcome) successor
+    successors = batch.nextStates[:, :, batch.outcomeMoves] + (np.arange(numGrids) * numStates)[:, None, None, None]
+
+    V = np.array(batch.cellRewards, dtype=float)
+    policy = np.zeros((numGrids, numStates), dtype=np.int64)
+    iterations = np.zeros(numGrids, dtype=np.int64)
+    live = np.arange(numGrids)
+    iteration = 0
+    start = time.perf_counter()
+
+    while live.size:
+        values = V.ravel()
+        probs = batch.outcomeProbs[live][:, None, :, :]
+
+        # same accumulation order as calculateValue: stay reward, then the
+        # intended, veer left, veer right and stay outcomes
+        Q = np.repeat(batch.cellRewards[live][:, :, None], batch.outcomeMoves.shape[0], axis=2)
+        for o in range(batch.outcomeMoves.shape[1]):
+            Q += probs[..., o] * (discount * values[successors[live, ..., o]])
+
+        active = batch.active[live]
+        newV = Q.max(axis=2)
+        if decimals is not None:
+            newV = np.round(newV, decimals)
+        newV = np.where(active, newV, V[live])
+
+        deltas = np.max(np.abs(newV - V[live]), axis=1, where=active, initial=0.0)
+        V[live] = newV
+
+        done = deltas < threshold
+        policy[live[done]] = np.argmax(Q[done], axis=2)
+        iterations[live[done]] = iteration
+
+        if observer is not None:
+            observer(iteration, deltas.max(), time.perf_counter() - start, V)
+
+        live = live[~done]
+        iteration += 1
+
+    return V, policy, iterations
+
+
+# Jacobi value iteration that streams over the grid in tiles of tileRows rows
+# instead of building a transition model. cellRewards, isObstacle and active
+# are (rows, cols) arrays (Gridworld arrays reshaped, or memmaps for grids
+# larger than RAM), outcomes is (outcomeMoves, outcomeProbs) from
+# Gridworld.outcomeTable() and store a valuestore.ValueStore receiving the
+# solution. Successors are found by shifting each tile, padded with one halo
+# row above and below, so only O(tileRows * cols) work memory is needed on
+# top of the store. Same update rule and stopping test as sparseValueIteration();
+# returns (V, policy, iterations) with V and policy flat views of the store.
+def tiledValueIteration(cellRewards, isObstacle, active, outcomes, discount, threshold, store,
+                        tileRows=TILE_ROWS, decimals=4, observer=None, maxIterations=None):
+    offsets = [gridworld.MOVE_OFFSETS[move] for move in gridworld.MOVES]
+    store.initialize(cellRewards, tileRows)
+
+    iteration = 0
+    start = time.perf_counter()
+    while True:
+        delta = _tiledSweep(store.values, store.scratch, store.policy, cellRewards, isObstacle, active,
+                            0, store.rows, tileRows, offsets, outcomes, discount, decimals)
+        store.swap()
+
+        if observer is not None:
+            observer(iteration, delta, time.perf_counter() - start, store.values.reshape(-1))
+
+        if delta < threshold or (maxIterations is not None and iteration + 1 >= maxIterations):
+            break
+
+        iteration += 1
+
+    store.finish()
+    return store.values.reshape(-1), store.policy.reshape(-1), iteration
+
+
+# One Jacobi sweep of the rows r0:r1, tile by tile: backs up from read into
+# write, writes the greedy actions into policy and returns the largest change
+def _tiledSweep(read, write, policy, cellRewards, isObstacle, active, r0, r1, tileRows, offsets, outcomes, discount, decimals):
+    outcomeMoves, outcomeProbs = outcomes
+    delta = 0.0
+
+    for t0 in range(r0, r1, tileRows):
+        t1 = min(t0 + tileRows, r1)
+        Q, old = _tileBackup(read, cellRewards, isObstacle, t0, t1, offsets, outcomeMoves, outcomeProbs, discount)
+
+        tileActive = np.asarray(active[t0:t1])
+        newValues = Q.max(axis=0)
+        if decimals is not None:
+            newValues = np.round(newValues, decimals)
+        newValues = np.where(tileActive, newValues, old).astype(write.dtype)
+
+        delta = max(delta, float(np.max(np.abs(newValues - old), where=tileActive, initial=0.0)))
+        write[t0:t1] = newValues
+        policy[t0:t1] = np.where(tileActive, np.argmax(Q, axis=0), -1)
+
+    return delta
+
+
+# tiledValueIteration() with the grid split into one row block per worker
+# process. The two value buffers, the policy and the layout live in shared
+# memory; every sweep each worker backs up its block from the read buffer
+# into the write buffer, reading the halo rows of the neighbouring blocks
+# from the read buffer, which nobody writes during the sweep. The sweep
+# ends when all blocks are done (the barrier that makes the halo rows of the
+# next sweep current), the global delta is the max of the block deltas and
+# the buffers swap roles. Each block runs the same _tiledSweep() as the
+# serial solver, so V, policy and iterations match tiledValueIteration().
+def parallelTiledValueIteration(cellRewards, isObstacle, active, outcomes, discount, threshold, store,
+                                workers=None, tileRows=TILE_ROWS, decimals=4, observer=None):
+    if workers is None:
+        workers = os.cpu_count() or 1
+    rows = store.rows
+    workers = max(1, min(workers, rows))
+    bounds = np.linspace(0, rows, workers + 1).astype(int)
+    blocks = [(int(r0), int(r1)) for r0, r1 in zip(bounds[:-1], bounds[1:]) if r1 > r0]
+
+    V0 = np.asarray(cellRewards, dtype=store.dtype)
+    arrays = {
+        "values0": V0,
+        "values1": V0,
+        "policy": np.full((rows, store.cols), -1, dtype=np.int8),
+        "cellRewards": cellRewards,
+        "isObstacle": isObstacle,
+        "active": active,
+    }
+    sweep = (tileRows, [gridworld.MOVE_OFFSETS[move] for move in gridworld.MOVES], outcomes, discount, decimals)
+
+    sharedBlocks, specs = sharedarrays.shareArrays(arrays)
+    pool = None
+    try:
+        sharedarrays.attachArrays(specs)
+        if workers > 1:
+            pool = ProcessPoolExecutor(max_workers=len(blocks), initializer=sharedarrays.attachArrays, initargs=(specs,))
+
+        iteration = 0
+        readIndex = 0
+        start = time.perf_counter()
+        while True:
+            tasks = [(r0, r1, readIndex) + sweep for r0, r1 in blocks]
+            if pool is None:
+                delta = max(_tiledBlock(task) for task in tasks)
+            else:
+                delta = max(pool.map(_tiledBlock, tasks))
+            readIndex = 1 - readIndex
+
+            # the shared buffers are unmapped on return, so observers get the
+            # values copied into the store, which stays valid
+            if observer is not None:
+                _copyShared(store, readIndex, tileRows, policy=False)
+                observer(iteration, delta, time.perf_counter() - start, store.values.reshape(-1))
+
+            if delta < threshold:
+                break
+
+            iteration += 1
+
+        _copyShared(store, readIndex, tileRows)
+    finally:
+        if pool is not None:
+            pool.shutdown()
+        sharedarrays.releaseArrays(sharedBlocks)
+
+    store.finish()
+    return store.values.reshape(-1), store.policy.reshape(-1), iteration
+
+
+# Copies the current shared values buffer, and the policy, into store
+# tileRows rows at a time
+def _copyShared(store, readIndex, tileRows, policy=True):
+    shared = sharedarrays.WORKER_ARRAYS
+    for r0 in range(0, store.rows, tileRows):
+        r1 = min(r0 + tileRows, store.rows)
+        store.values[r0:r1] = shared[f"values{readIndex}"][r0:r1]
+        if policy:
+            store.policy[r0:r1] = shared["policy"][r0:r1]
+
+
+# Worker task of parallelTiledValueIteration(): one sweep of one row block
+def _tiledBlock(task):
+    r0, r1, readIndex, tileRows, offsets, outcomes, discount, decimals = task
+    arrays = sharedarrays.WORKER_ARRAYS
+    return _tiledSweep(arrays[f"values{readIndex}"], arrays[f"values{1 - readIndex}"], arrays["policy"],
+                       arrays["cellRewards"], arrays["isObstacle"], arrays["active"],
+                       r0, r1, tileRows, offsets, outcomes, discount, decimals)
+
+
+# Q[a] of the rows r0:r1 of a tiled grid, plus the current values of those
+# rows. Cells outside the grid (the padding around the tile) and obstacles
+# block moves, so a blocked successor is the cell itself.
+def _tileBackup(values, cellRewards, isObstacle, r0, r1, offsets, outcomeMoves, outcomeProbs, discount):
+    lo, hi = max(r0 - 1, 0), min(r1 + 1, values.shape[0])
+    height, cols = r1 - r0, values.shape[1]
+
+    paddedV = np.zeros((height + 2, cols + 2))
+    paddedBlocked = np.ones((height + 2, cols + 2), dtype=bool)
+    top = 1 - (r0 - lo)
+    paddedV[top:top + hi - lo, 1:-1] = values[lo:hi]
+    paddedBlocked[top:top + hi - lo, 1:-1] = isObstacle[lo:hi]
+
+    current = paddedV[1:-1, 1:-1]
+    successorValues = []
+    for dr, dc in offsets:
+        shifted = paddedV[1 + dr:1 + dr + height, 1 + dc:1 + dc + cols]
+        blocked = paddedBlocked[1 + dr:1 + dr + height, 1 + dc:1 + dc + cols]
+        successorValues.append(current if (dr, dc) == (0, 0) else np.where(blocked, current, shifted))
+
+    # same accumulation order as calculateValue: stay reward, then the
+    # intended, veer left, veer right and stay outcomes
+    rewards = np.asarray(cellRewards[r0:r1], dtype=float)
+    Q = np.empty((outcomeMoves.shape[0], height, cols))
+    for a in range(outcomeMoves.shape[0]):
+        Q[a] = rewards
+        for o in range(outcomeMoves.shape[1]):
+            Q[a] += outcomeProbs[a, o] * (discount * successorValues[outcomeMoves[a, o]])
+
+    return Q, current.copy()
+
+
+# Entries of the given SparseModel rows as (localRowIds, indices, probs, rewards),
+# localRowIds numbering the requested rows 0..len(rows)-1
+def gatherRows(model, rows):
+    rows = np.asarray(rows)
+    starts = model.indptr[rows]
+    lengths = model.indptr[rows + 1] - starts
+
+    localRowIds = np.repeat(np.arange(rows.size), lengths)
+    offsets = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    entries = np.repeat(starts, lengths) + offsets
+
+    return localRowIds, model.indices[entries], model.probs[entries], model.rewards[rows]
+
+
+# Rows of a SparseModel for a fixed policy, as (rowIds, indices, probs, rewards)
+# with one row per state
+def policyTransitions(model, policy):
+    return gatherRows(model, np.arange(model.numStates) * model.numActions + np.asarray(policy))
+
+
+# Iterative evaluation of a fixed policy (action index per state) on a
+# gridworld.SparseModel. Returns (V, iterations).
+def sparsePolicyEvaluation(model, policy, V0, active, discount, threshold, observer=None):
+    V = np.array(V0, dtype=float)
+    rowIds, indices, probs, rewards = policyTransitions(model, policy)
+    iteration = 0
+    start = time.perf_counter()
+
+    while True:
+        expected = np.bincount(rowIds, weights=probs * V[indices], minlength=model.numStates)
+        newV = V.copy()
+        newV[active] = (rewards + discount * expected)[active]
+
+        delta = np.max(np.abs(newV - V)[active], initial=0.0)
+        V = newV
+
+        if observer is not None:
+            observer(iteration, delta, time.perf_counter() - start, V)
+
+        if delta < threshold:
+            break
+
+        iteration += 1
+
+    return V, iteration
+
+
+# In-place (Gauss-Seidel) value iteration on a gridworld.SparseModel. order is
+# a list of index arrays, e.g. from Gridworld.sweepOrder(); each block is
+# backed up in turn against the values already updated earlier in the same
+# sweep, so information can cross the whole grid in a single sweep. States
+# within one block are updated together, which is exact Gauss-Seidel when no
+# two states of a block are neighbours (single states, or the BFS layers of
+# Gridworld.sweepOrder("bfs"), which are split by checkerboard colour).
+# order=None visits one state at a time in index order.
+# Returns (V, policy, iterations) like sparseValueIteration().
+def gaussSeidelValueIteration(model, V0, active, discount, threshold, order=None, decimals=4, observer=None):
+    V = np.array(V0, dtype=float)
+    policy = np.zeros(model.numStates, dtype=np.int64)
+    if order is None:
+        order = np.arange(model.numStates).reshape(-1, 1)
+
+    # precompute the transitions of the active states of every block
+    blocks = []
+    for block in order:
+        block = np.asarray(block)
+        block = block[active[block]]
+        if block.size == 0:
+            continue
+        rows = (block[:, None] * model.numActions + np.arange(model.numActions)).ravel()
+        blocks.append((block, gatherRows(model, rows)))
+
+    iteration = 0
+    start = time.perf_counter()
+    while True:
+        delta = 0.0
+
+        for block, (rowIds, indices, probs, rewards) in blocks:
+            expected = np.bincount(rowIds, weights=probs * V[indices], minlength=rewards.size)
+            Q = (rewards + discount * expected).reshape(block.size, model.numActions)
+
+            newValues = Q.max(axis=1)
+            if decimals is not None:
+                newValues = np.round(newValues, decimals)
+
+            delta = max(delta, float(np.max(np.abs(newValues - V[block]))))
+            V[block] = newValues
+            policy[block] = np.argmax(Q, axis=1)
+
+        if observer is not None:
+            observer(iteration, delta, time.perf_counter() - start, V)
+
+        if delta < threshold:
+            break
+
+        iteration += 1
+
+    return V, policy, iteration
+
+
+# Q[a] of a single state of a gridworld.SparseModel
+def stateBackup(model, V, state, discount):
+    first = state * model.numActions
+    start = model.indptr[first]
+    end = model.indptr[first + model.numActions]
+    weighted = model.probs[start:end] * V[model.indices[start:end]]
+    expected = np.add.reduceat(weighted, model.indptr[first:first + model.numActions] - start)
+    return model.rewards[first:first + model.numActions] + discount * expected
+
+
+# Prioritized sweeping on a gridworld.SparseModel. States sit in a heap keyed by
+# their Bellman residual; the largest one is backed up and its predecessors
+# (from gridworld.predecessorIndex) get their residuals refreshed and pushed.
+# Stops when every residual is below threshold, the same test as the sweep
+# based solvers. Returns (V, policy, backups), backups counting every
+# single-state Bellman backup computed, including the seed sweep and the
+# residual refreshes of predecessors, so it compares directly with sweeps
+# times active states of the sweep based solvers. The observer is called
+# about every numStates backups with the backup count and the largest
+# residual still queued.
+def prioritizedSweeping(model, V0, active, discount, threshold, decimals=4, predecessors=None, observer=None):
+    V = np.array(V0, dtype=float)
+    start = time.perf_counter()
+    predptr, preds = predecessors if predecessors is not None else gridworld.predecessorIndex(model)
+
+    def residual(state):
+        value = stateBackup(model, V, state, discount).max()
+        if decimals is not None:
+            value = round(value, decimals)
+        return value, abs(value - V[state])
+
+    # seed the heap with one full sweep worth of residuals
+    Q = sparseBackup(model, V, discount)
+    target = Q.max(axis=1)
+    if decimals is not None:
+        target = np.round(target, decimals)
+    priority = np.where(active, np.abs(target - V), 0.0)
+
+    heap = [(-priority[s], s) for s in np.flatnonzero(priority >= threshold)]
+    heapq.heapify(heap)
+    backups = int(np.count_nonzero(active))
+    nextObserve = backups + model.numStates
+
+    while heap:
+        negPriority, state = heapq.heappop(heap)
+        if -negPriority != priority[state]:
+            continue # stale entry
+
+        V[state], _ = residual(state)
+        priority[state] = 0.0
+        backups += 1
+
+        for pred in preds[predptr[state]:predptr[state + 1]]:
+            if not active[pred]:
+                continue
+            _, error = residual(pred)
+            backups += 1
+            if error >= threshold and error != priority[pred]:
+                priority[pred] = error
+                heapq.heappush(heap, (-error, pred))
+
+        if observer is not None and backups >= nextObserve:
+            observer(backups, -heap[0][0] if heap else 0.0, time.perf_counter() - start, V)
+            nextObserve = backups + model.numStates
+
+    policy = np.argmax(sparseBackup(model, V, discount), axis=1)
+    return V, policy, backups
+
+
+# Exact value of a fixed policy: solves (I - discount * P_pi) V = r_pi over the
+# active states, inactive states keep their V0 value. Uses a sparse LU solve
+# when scipy is available and a dense solve otherwise.
+def exactPolicyEvaluation(model, policy, V0, active, discount):
+    V = np.array(V0, dtype=float)
+    rowIds, indices, probs, rewards = policyTransitions(model, policy)
+
+    activeIndex = np.flatnonzero(active)
+    position = np.full(model.numStates, -1)
+    position[activeIndex] = np.arange(activeIndex.size)
+
+    # split each transition into the unknown (active) and the fixed part
+    toActive = active[indices]
+    b = rewards[activeIndex].copy()
+    fromActive = active[rowIds]
+    fixed = fromActive & ~toActive
+    np.add.at(b, position[rowIds[fixed]], discount * probs[fixed] * V[indices[fixed]])
+
+    inner = fromActive & toActive
+    rows = position[rowIds[inner]]
+    cols = position[indices[inner]]
+    if scipySparse is not None:
+        M = scipySparse.csr_matrix((probs[inner], (rows, cols)), shape=(activeIndex.size, activeIndex.size))
+        A = scipySparse.identity(activeIndex.size, format="csr") - discount * M
+        V[activeIndex] = scipyLinalg.spsolve(A.tocsc(), b)
+    else:
+        A = np.identity(activeIndex.size)
+        np.add.at(A, (rows, cols), -discount * probs[inner])
+        V[activeIndex] = np.linalg.solve(A, b)
+
+    return V
+
+
+# Greedy policy for V that keeps the current action wherever it is still
+# within tie tolerance of the best one, so policy iteration cannot cycle
+def improvePolicy(Q, policy, tolerance=1e-12):
+    greedy = np.argmax(Q, axis=1)
+    current = Q[np.arange(Q.shape[0]), policy]
+    return np.where(current >= Q.max(axis=1) - tolerance, policy, greedy)
+
+
+# Policy iteration on a gridworld.SparseModel with exact evaluation. threshold
+# is not needed for convergence, it is accepted so all solvers share one
+# signature. Returns (V, policy, iterations), iterations counting improvements.
+# The observer's delta is the largest value change between evaluations.
+def policyIteration(model, V0, active, discount, threshold=None, maxIterations=1000, observer=None):
+    V = np.array(V0, dtype=float)
+    policy = np.argmax(sparseBackup(model, V, discount), axis=1)
+    iteration = 0
+    start = time.perf_counter()
+
+    while iteration < maxIterations:
+        newV = exactPolicyEvaluation(model, policy, V0, active, discount)
+        delta = np.max(np.abs(newV - V)[active], initial=0.0)
+        V = newV
+        newPolicy = improvePolicy(sparseBackup(model, V, discount), policy)
+
+        if observer is not None:
+            observer(iteration, delta, time.perf_counter() - start, V)
+
+        if np.array_equal(newPolicy[active], policy[active]):
+            break
+
+        policy = newPolicy
+        iteration += 1
+
+    return V, policy, iteration
+
+
+# Modified policy iteration on a gridworld.SparseModel: each iteration takes
+# the greedy policy for V and applies k sweeps of its Bellman operator.
+# Stops when the greedy backup changes V by less than threshold, the same test
+# as value iteration (k=1 is value iteration). Returns (V, policy, iterations).
+def modifiedPolicyIteration(model, V0, active, discount, threshold, k=10, observer=None):
+    V = np.array(V0, dtype=float)
+    rowIds = np.repeat(np.arange(model.numStates * model.numActions), np.diff(model.indptr))
+    iteration = 0
+    start = time.perf_counter()
+
+    while True:
+        Q = sparseBackup(model, V, discount, rowIds)
+        policy = np.argmax(Q, axis=1)
+
+        newV = V.copy()
+        newV[active] = Q.max(axis=1)[active]
+        delta = np.max(np.abs(newV - V)[active], initial=0.0)
+        V = newV
+
+        if observer is not None:
+            observer(iteration, delta, time.perf_counter() - start, V)
+
+        if delta < threshold:
+            break
+
+        # k - 1 more partial evaluation sweeps with the policy held fixed
+        piRowIds, indices, probs, rewards = policyTransitions(model, policy)
+        for _ in range(k - 1):
+            expected = np.bincount(piRowIds, weights=probs * V[indices], minlength=model.numStates)
+            V[active] = (rewards + discount * expected)[active]
+
+        iteration += 1
+
+    return V, policy, iteration
+
+
+# Solvers sharing the (model, V0, active, discount, threshold, **options)
+# signature on a gridworld.SparseModel, all returning (V, policy, iterations)
+SOLVERS = {
+    "sparse": sparseValueIteration,
+    "gauss-seidel": gaussSeidelValueIteration,
+    "prioritized": prioritizedSweeping,
+    "policy-iteration": policyIteration,
+    "modified-policy-iteration": modifiedPolicyIteration,
+}
+
+
+def solve(method, model, V0, active, discount, threshold, **options):
+    if method not in SOLVERS:
+        raise ValueError(f"unknown solver {method!r}, expected one of {list(SOLVERS)}")
+    return SOLVERS[method](model, V0, active, discount, threshold, **options)
+
+
+# Result of one point of parameterSweep(): the solution for (discount,
+# threshold), its iteration count and wall time, and the (discount, threshold)
+# point it was warm-started from (None for a cold start from V0)
+SweepPoint = namedtuple("SweepPoint", ["discount", "threshold", "V", "policy", "iterations", "seconds", "warmStart"])
+
+
+# Order in which parameterSweep() solves a parameter grid: discounts from
+# smallest to largest (small discounts converge fastest and bound the values
+# of the larger ones from below) and, per discount, thresholds from loosest to
+# tightest so every tight solve continues from a looser one
+def sweepSchedule(discounts, thresholds):
+    return [(discount, threshold) for discount in sorted(set(discounts)) for threshold in sorted(set(thresholds), reverse=True)]
+
+
+# Solves model for every (discount, threshold) pair with solve(method, ...),
+# warm-starting each point from the nearest point already solved: the closest
+# discount, and among equally close ones the tightest threshold. Terminal and
+# obstacle values are never changed by a solve, so every solved V is a valid V0.
+# Returns a list of SweepPoint in solve order.
+def parameterSweep(model, V0, active, discounts, thresholds, method="sparse", warmStart=True, **options):
+    points = []
+    for discount, threshold in sweepSchedule(discounts, thresholds):
+        source = None
+        if warmStart and points:
+            source = min(points, key=lambda p: (abs(p.discount - discount), p.threshold))
+
+        start = time.perf_counter()
+        V, policy, iterations = solve(method, model, V0 if source is None else source.V, active, discount, threshold, **options)
+        seconds = time.perf_counter() - start
+
+        points.append(SweepPoint(
+            discount=discount,
+            threshold=threshold,
+            V=V,
+            policy=policy,
+            iterations=iterations,
+            seconds=seconds,
+            warmStart=None if source is None else (source.discount, source.threshold),
+        ))
+
+    return points
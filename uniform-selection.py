@@ -10,25 +10,42 @@ import numpy as np
 import random
 import math
 
+import gridworld
+import instrumentation
+import rollouts
+from returnstats import ReturnStatistics
+
 # globals
-GRID_ROWS = 5
-GRID_COLS = 5
-START_STATE = (0, 0)
-GOAL_STATE = (4, 4)
-OBSTACLES = [(2,2),(3,2)]
-WATER_STATE = (4,2)
-ALL_STATES = [(i,j) for i in range(GRID_COLS) for j in range(GRID_ROWS)]
+GRID_CONFIG = {
+    "rows": 5,
+    "cols": 5,
+    "start": (0, 0),
+    "goals": [(4, 4)],
+    "water": [(4,2)],
+    "obstacles": [(2,2),(3,2)],
+}
+ACTION_MOVES = {"up": "U", "down": "D", "left": "L", "right": "R"}
 
 DISCOUNT_FACTOR = 0.9
 MAX_EPISODES = 10000
-
-# Reward structure:
+SIMULATOR = "python" # "python" for uniformRandomSelection(), "batched" or "parallel" for the array simulators
+SEED = None # seed for the batched simulator and the python simulator's slip draws, None for fresh entropy
+STOCHASTIC = False # sample the 0.8/0.05/0.05/0.10 dynamics in the simulators instead of moving as intended
+WORKERS = None # processes for the parallel simulator, None for all cores
+HISTOGRAM_RANGE = None # (low, high) to also collect a return histogram and quantiles
+TOLERANCE = None # stop once the 95% CI on the mean return is narrower than this, None to run MAX_EPISODES
+CHECK_EVERY = 1000 # episodes between convergence checks in the python simulator
+INSTRUMENT = False # collect phase timers and counters and write them to REPORT_FILE
+PROFILER = None # with INSTRUMENT, also profile the run: "cprofile" or "sampling", see instrumentation.PROFILERS
+REPORT_FILE = "uniform-selection-report.json" # JSON run report, the profile is written next to it
+
+# Reward structure (defaults, see gridworld.Gridworld):
 # 0 as default
 # +10 for goal state
 # -10 for water state
 # -1 for hitting obstacle/attempt to leave grid
 
-# Grid structure:
+# Default grid structure:
 # (0,0) (0,1) (0,2) (0,3) (0,4)
 # (1,0) (1,1) (1,2) (1,3) (1,4)
 # (2,0) (2,1) (2,2) (2,3) (2,4)
@@ -36,12 +53,14 @@ MAX_EPISODES = 10000
 # (4,0) (4,1) (4,2) (4,3) (4,4)
 
 
+# Gridworld compiled from GRID_CONFIG, built once and reused until GRID_CONFIG changes
+def environment():
+    return gridworld.getGridworld(**GRID_CONFIG)
+
+
 def isValidState(stateCord):
-    if (stateCord[0] >= 0) and (stateCord[0] <= (GRID_ROWS-1)):
-        if (stateCord[1] >= 0) and (stateCord[1] <= (GRID_COLS-1)):
-            if stateCord not in OBSTACLES:
-                return True
-    return False # obstacle or outside grid
+    env = environment()
+    return env.inBounds(stateCord) and stateCord not in env.obstacles # obstacle or outside grid
 
 
 def getActionSpace():
@@ -50,107 +69,154 @@ def getActionSpace():
         
 
 def initRewardFunction():
-    goalReward = 10
-    waterReward = -10
-    obstacleReward = -1
-    defaultReward = 0
-    rewards = {}
-
-    for state in ALL_STATES:
-        if state == GOAL_STATE:
-            rewards[state] = goalReward
-        elif state == WATER_STATE:
-            rewards[state] = waterReward
-        elif state in OBSTACLES:
-            rewards[state] = obstacleReward
-        else:
-            rewards[state] = defaultReward
-
-    return rewards
+    return dict(environment().environmentModel().rewards)
 
 
 # move agent up, down, left, or right given current state cord
 # returns next state cord, and reward from the action taken
-def makeAction(currStateCord, action):
-    reward = 0 # default
-
-    if action == "up":
-        nextStateCord = (currStateCord[0]-1, currStateCord[1])
-    elif action == "down":
-        nextStateCord = (currStateCord[0]+1, currStateCord[1])
-    elif action == "left":
-        nextStateCord = (currStateCord[0], currStateCord[1]-1)
-    elif action == "right":
-        nextStateCord = (currStateCord[0], currStateCord[1]+1)
-    else:
+# (the reward of the cell entered, or the obstacle reward when the move
+# leaves the grid or hits an obstacle and the agent stays put)
+def makeAction(currStateCord, action, model=None):
+    if action not in ACTION_MOVES:
         return currStateCord, 0 # return 0 reward for invalid actions
 
-    # make sure nextStateCord is within board boundaries AND not an obstacle
-    if isValidState(nextStateCord):
-        if nextStateCord == GOAL_STATE:
-            reward = 10
-            return nextStateCord, reward
-        elif nextStateCord == WATER_STATE:
-            reward = -10
-            return nextStateCord, reward
-        else:
-            # give default
-            return nextStateCord, reward
-    else:
-        # hit obstacle/attempt to leave grid
-        reward = -1
-        return currStateCord, reward
+    if model is None:
+        model = environment().environmentModel()
+
+    return model.steps[(currStateCord, ACTION_MOVES[action])]
 
 
 # Question 1 - Part 1 (Have the agent uniformly randomly select actions. Run 10,000 episodes.)
 def uniformRandomSelection():
     print("Running uniform random selection...")
-    
-    discountedReturns = []
 
-    for episode in range(MAX_EPISODES):
-        currState = START_STATE
-        discountedReturn = 0
-        timestep = 0
+    with instrumentation.phase("uniformRandomSelection.setup"):
+        env = environment()
+        model = env.environmentModel()
+        rng = random.Random(SEED) if STOCHASTIC else None
+        stats = ReturnStatistics(HISTOGRAM_RANGE)
+    steps = 0
+    waterHits = 0
+
+    with instrumentation.phase("uniformRandomSelection.episodes"):
+        for episode in range(MAX_EPISODES):
+            currState = env.start
+            discountedReturn = 0
+            timestep = 0
+
+            while currState not in env.goals:
+
+                # np.random uniformly distributes probablity between choices
+                action = np.random.choice(getActionSpace())
+
+                # get next state and the reward for the action, with
+                # STOCHASTIC the move actually made is sampled
+                if rng is None:
+                    nextState, reward = makeAction(currState, action, model)
+                else:
+                    nextIndex, reward = env.sampleStep(env.toIndex(currState), gridworld.ACTIONS.index(ACTION_MOVES[action]), rng.random())
+                    nextState = env.toState(nextIndex)
+
+                # calculate discounted return
+                discountedReturn += reward * (DISCOUNT_FACTOR ** timestep)
+                timestep += 1
+
+                # update current state to next state
+                currState = nextState
+
+                # if agent gets stuck in water, go to next episode
+                if currState in env.water:
+                    waterHits += 1
+                    break
+
+            # add the episodes final discounted return
+            stats.add(discountedReturn)
+            steps += timestep
+
+            # stop early once the estimate of the mean is tight enough
+            if (episode + 1) % CHECK_EVERY == 0 and stats.converged(TOLERANCE):
+                break
 
-        while currState != GOAL_STATE:
+    instrumentation.count("episodes", stats.count)
+    instrumentation.count("steps", steps)
+    instrumentation.count("waterHits", waterHits)
+    return stats
 
-            # np.random uniformly distributes probablity between choices
-            action = np.random.choice(getActionSpace())
 
-            # get next state and the reward for the action
-            nextState, reward = makeAction(currState, action)
+# Step table used by the array based simulators
+def rolloutArrays():
+    return environment().stepTable()
 
-            # calculate discounted return
-            discountedReturn += reward * (DISCOUNT_FACTOR ** timestep)
-            timestep += 1
 
-            # update current state to next state
-            currState = nextState
+# Same experiment as uniformRandomSelection(), with all episodes simulated in
+# lockstep by rollouts.streamRollouts() and one batched action draw per step
+def batchedUniformRandomSelection(numEpisodes=None):
+    print("Running uniform random selection...")
+    nextStates, stepRewards, isTerminal = rolloutArrays()
+    if numEpisodes is None:
+        numEpisodes = MAX_EPISODES
+    counters = {"steps": 0}
+
+    stats = rollouts.streamRollouts(nextStates, stepRewards, isTerminal, environment().startIndex,
+                                    numEpisodes, DISCOUNT_FACTOR, rng=np.random.default_rng(SEED),
+                                    outcomes=environment().outcomeTable() if STOCHASTIC else None,
+                                    stats=ReturnStatistics(HISTOGRAM_RANGE), tolerance=TOLERANCE, counters=counters)
+    instrumentation.count("episodes", stats.count)
+    instrumentation.count("steps", counters["steps"])
+    return stats
+
+
+# Same experiment as batchedUniformRandomSelection(), sharded over WORKERS processes
+def parallelUniformRandomSelection(numEpisodes=None, workers=None):
+    print("Running uniform random selection...")
+    nextStates, stepRewards, isTerminal = rolloutArrays()
+    if numEpisodes is None:
+        numEpisodes = MAX_EPISODES
+    counters = {"steps": 0}
 
-            # if agent gets stuck in water, go to next episode
-            if currState == WATER_STATE:
-                break
+    stats = rollouts.parallelRollouts(nextStates, stepRewards, isTerminal, environment().startIndex,
+                                      numEpisodes, DISCOUNT_FACTOR, seed=SEED,
+                                      outcomes=environment().outcomeTable() if STOCHASTIC else None,
+                                      workers=WORKERS if workers is None else workers, histogramRange=HISTOGRAM_RANGE,
+                                      tolerance=TOLERANCE, counters=counters)
+    instrumentation.count("episodes", stats.count)
+    instrumentation.count("steps", counters["steps"])
+    return stats
 
-        # add the episodes final discounted return
-        discountedReturns.append(discountedReturn)
 
-    return discountedReturns
+# Runs main(), under an instrumentation.Instrumentation with INSTRUMENT set
+def instrumentedMain():
+    if not INSTRUMENT:
+        return main()
+
+    with instrumentation.Instrumentation("uniform-selection", PROFILER) as probe:
+        main()
+    probe.writeReport(REPORT_FILE)
+    print(f"Run report written to {REPORT_FILE}")
 
 
 def main():
-    returns = uniformRandomSelection()
-    
-    mean_return = np.mean(returns)
-    std_return = np.std(returns)
-    max_return = np.max(returns)
-    min_return = np.min(returns)
+    with instrumentation.phase("simulate"):
+        if SIMULATOR == "parallel":
+            stats = parallelUniformRandomSelection()
+        elif SIMULATOR == "batched":
+            stats = batchedUniformRandomSelection()
+        else:
+            stats = uniformRandomSelection()
+
+    summary = stats.summary()
+    mean_return = summary["mean"]
+    std_return = summary["std"]
+    max_return = summary["max"]
+    min_return = summary["min"]
 
     print(f"Mean discounted return: {mean_return:.2f}")
     print(f"Standard deviation of discounted returns: {std_return:.2f}")
     print(f"Maximum discounted return: {max_return:.2f}")
     print(f"Minimum discounted return: {min_return:.2f}")
+    print(f"Episodes used: {summary['count']}")
+    print(f"95% confidence interval of the mean: [{summary['ciLow']:.2f}, {summary['ciHigh']:.2f}]")
 
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    instrumentedMain()
\ No newline at end of file
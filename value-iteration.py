@@ -2,10 +2,19 @@
 # -*- coding: utf-8 -*-
 
 import sys
+import time
 import numpy as np
 import random
 import math
 
+import gridworld
+import instrumentation
+import policycache
+import rollouts
+import solvers
+import valuestore
+from returnstats import ReturnStatistics
+
 # Value iteration implementation for Gridworld with following environment dynamics:
 # 1. Probability of 0.8 the agent moves in a specified direction.
 # 2. Probability of 0.05 it gets confused and veers to the right (i.e. -90deg from where it attempted to move)
@@ -13,8 +22,10 @@ import math
 # 4. Probability of 0.10 the agent temporarily breaks and does not move at all
 # 5. If dynamics would cause the agent to EXIT (leave grid boundary) or hit OBSTACLE then the agent does not move
 # 6. Start in STATE = (0,0) and the process ends when STATE = (4,4)
+# The layout lives in GRID_CONFIG (keyword arguments of gridworld.Gridworld), so
+# grid size, goals, water, obstacles, rewards and slip probabilities can be changed there.
 
-# Grid structure:
+# Default grid structure:
 # (0,0) (0,1) (0,2) (0,3) (0,4)
 # (1,0) (1,1) (1,2) (1,3) (1,4)
 # (2,0) (2,1) (2,2) (2,3) (2,4)
@@ -27,65 +38,65 @@ import math
 # -10 for water state
 # -1 for hitting obstacle/attempt to leave grid
 
-GRID_SIZE = 5
-START_STATE = (0,0)
-GOAL_STATE = (4,4)
-WATER_STATE = (4,2)
-OBSTACLES = [(2,2),(3,2)]
-TERMINAL_STATES = [WATER_STATE, GOAL_STATE]
-STATES = [(i,j) for i in range(GRID_SIZE) for j in range(GRID_SIZE)]
+GRID_CONFIG = {
+    "rows": 5,
+    "cols": 5,
+    "start": (0,0),
+    "goals": [(4,4)],
+    "water": [(4,2)],
+    "obstacles": [(2,2),(3,2)],
+}
 ACTIONS = ['U', 'D', 'L', 'R'] # up, down, left, right, no action
 
 DISCOUNT_FACTOR = 0.9
 THRESHOLD = 0.0001
 MAX_EPISODES = 10000
+SOLVER = "python" # "python" for valueIteration(), "numpy", "tiled", "parallel-tiled" or a solvers.SOLVERS name for vectorizedValueIteration()
+SWEEP_ORDER = "bfs" # gauss-seidel sweep order, one of gridworld.SWEEP_ORDERS
+MPI_SWEEPS = 10 # partial evaluation sweeps per modified policy iteration step
+VALUE_DTYPE = "float64" # "float32" halves the value storage of the tiled solver
+TILE_ROWS = 256 # grid rows backed up at a time by the tiled solver
+VALUE_STORE_DIR = None # directory for memory-mapped tiled solver storage, None to keep it in RAM
+SOLVER_WORKERS = None # processes for the parallel-tiled solver, None for all cores
+PROGRESS = "full" # solver output per iteration: "quiet", "summary" or "full" (prints V every sweep, "summary" above PRINT_MAX_CELLS)
+PRINT_MAX_CELLS = 10000 # largest grid whose values and policy are printed
+PROGRESS_EVERY = 10 # iterations between lines of the "summary" output
+SIMULATOR = "python" # "python" for runOptimalPolicy(), "batched" or "parallel" for the array simulators
+SEED = None # seed for the batched simulator and the python simulator's slip draws, None for fresh entropy
+STOCHASTIC = False # sample the 0.8/0.05/0.05/0.10 dynamics in the simulators instead of moving as intended
+WORKERS = None # processes for the parallel simulator, None for all cores
+HISTOGRAM_RANGE = None # (low, high) to also collect a return histogram and quantiles
+TOLERANCE = None # stop once the 95% CI on the mean return is narrower than this, None to run MAX_EPISODES
+CHECK_EVERY = 1000 # episodes between convergence checks in the python simulator
+CACHE = True # load/store solutions in the on-disk policy cache (policycache.CACHE_DIR)
+INSTRUMENT = False # collect phase timers and counters and write them to REPORT_FILE
+PROFILER = None # with INSTRUMENT, also profile the run: "cprofile" or "sampling", see instrumentation.PROFILERS
+REPORT_FILE = "value-iteration-report.json" # JSON run report, the profile is written next to it
+
+
+# Gridworld compiled from GRID_CONFIG, built once and reused until GRID_CONFIG changes
+def environment():
+    return gridworld.getGridworld(**GRID_CONFIG)
 
 
 def inBounds(state):
-    if (state[0] >= 0) and (state[0] <= (GRID_SIZE-1)):
-        if (state[1] >= 0) and (state[1] <= (GRID_SIZE-1)):
-            return True
-    return False
+    return environment().inBounds(state)
 
 
-def rewardFunction():
-    rewards = {}
-    goalReward = 10
-    waterReward = -10
-    obstacleReward = -1
-    defaultReward = 0
-
-    for state in STATES:
-        if state == GOAL_STATE:
-            rewards[state] = goalReward
-        elif state == WATER_STATE:
-            rewards[state] = waterReward
-        elif state in OBSTACLES:
-            rewards[state] = obstacleReward
-        else:
-            rewards[state] = defaultReward
+# Precomputed rewards and successor lookups for the current layout
+def environmentModel():
+    return environment().environmentModel()
 
-    return rewards
 
+def rewardFunction():
+    return dict(environmentModel().rewards)
 
-def takeAction(state, action):
-    R = rewardFunction()
 
-    if action == "U":
-        nextState = (state[0]-1, state[1])
-    elif action == "D":
-        nextState = (state[0]+1, state[1])
-    elif action == "L":
-        nextState = (state[0], state[1]-1)
-    elif action == "R":
-        nextState = (state[0], state[1]+1)
-    elif action == "stay": # stay still
-        nextState = (state)
+def takeAction(state, action, model=None):
+    if model is None:
+        model = environmentModel()
 
-    if not inBounds(nextState) or nextState in OBSTACLES:
-        return state, -1
-    
-    return nextState, R[nextState]
+    return model.steps[(state, action)]
 
 
 def goLeft(intendedAction):
@@ -109,58 +120,83 @@ def goRight(intendedAction):
         return 'U'
 
 
-def calculateValue(V, state, action):
-
-    newStateIntended, reward = takeAction(state, action)
-    newStateVeerLeft, reward = takeAction(state, goLeft(action))
-    newStateVeerRight, reward = takeAction(state, goRight(action))
-    stayState, reward = takeAction(state, "stay")
+def calculateValue(V, state, action, model=None):
+    if model is None:
+        model = environmentModel()
 
-    v = reward
-    v += 0.8 * (DISCOUNT_FACTOR * V[newStateIntended]) # take intended action
-    v += 0.05 * (DISCOUNT_FACTOR * V[newStateVeerLeft]) # veer left
-    v += 0.05 * (DISCOUNT_FACTOR * V[newStateVeerRight]) # veer right
-    v += 0.10 * (DISCOUNT_FACTOR * V[stayState]) # stay still
+    # outcomes are intended action, veer left, veer right, stay still
+    v = model.steps[(state, "stay")][1]
+    for prob, nextState in model.outcomes[(state, action)]:
+        v += prob * (DISCOUNT_FACTOR * V[nextState])
 
     return v
 
 
-def valueIteration():
-    V = rewardFunction() # initialize V to reward function
-    policy = {} # initialize empty policy
+# Solver observer selected by PROGRESS, see solvers.quietObserver()
+def progressObserver():
+    if PROGRESS == "quiet":
+        return solvers.quietObserver
+    if PROGRESS == "summary":
+        return solvers.summaryObserver(PROGRESS_EVERY)
+    if environment().numStates > PRINT_MAX_CELLS:
+        return solvers.summaryObserver(PROGRESS_EVERY)
+    return solvers.fullDumpObserver(environment().cols)
+
+
+def valueIteration(observer=None):
+    if observer is None:
+        observer = progressObserver()
+
+    with instrumentation.phase("valueIteration.setup"):
+        env = environment()
+        model = env.environmentModel()
+        V = rewardFunction() # initialize V to reward function
+        policy = {} # initialize empty policy
+
+        # states and calculateValue() outcomes per sweep, only counted while instrumented
+        backups = transitions = 0
+        if instrumentation.ACTIVE is not None:
+            backups = sum(1 for state in env.states if state not in model.skip)
+            transitions = sum(len(model.outcomes[(state, action)]) for state in env.states if state not in model.skip for action in ACTIONS)
 
     iteration = 0
     converged = False
+    start = time.perf_counter()
 
     # Keep iterating until the value function converges
     while not converged:
         delta = 0
-        newV = rewardFunction()
+        with instrumentation.phase("valueIteration.rewardFunction"):
+            newV = rewardFunction()
 
-        for state in STATES:
-            if state not in TERMINAL_STATES + OBSTACLES:
-                
-                # computing v for each action
-                actionValues = [calculateValue(V, state, action) for action in ACTIONS]
+        with instrumentation.phase("valueIteration.backups"):
+            for state in env.states:
+                if state not in model.skip:
 
-                # update value function with max v
-                newV[state] = round(max(actionValues), 4)
+                    # computing v for each action
+                    actionValues = [calculateValue(V, state, action, model) for action in ACTIONS]
 
-                # use index of max v to get corresponding action 
-                bestAction = ACTIONS[np.argmax(actionValues)]
+                    # update value function with max v
+                    newV[state] = round(max(actionValues), 4)
 
-                # update policy with best action
-                policy[state] = bestAction
+                    # use index of max v to get corresponding action
+                    bestAction = ACTIONS[np.argmax(actionValues)]
 
-                # update difference between old V and new V for convergence check
-                delta = max(delta, abs(newV[state] - V[state]))
+                    # update policy with best action
+                    policy[state] = bestAction
+
+                    # update difference between old V and new V for convergence check
+                    delta = max(delta, abs(newV[state] - V[state]))
+
+        instrumentation.count("sweeps")
+        instrumentation.count("backups", backups)
+        instrumentation.count("transitions", transitions)
 
         # update value function
         V = newV
-        
-        print(f"VI iteration {iteration}:")
-        visualizeV(V)
-        print()
+
+        with instrumentation.phase("valueIteration.observer"):
+            observer(iteration, delta, time.perf_counter() - start, V)
 
         # check for convergence
         if delta < THRESHOLD:
@@ -173,12 +209,144 @@ def valueIteration():
     return V, policy
 
 
-def visualizeV(V):
+# Same solution as valueIteration(), computed with numpy and returned as flat
+# float64 values and an int8 policy (Gridworld.policyArray()). "numpy" runs
+# batched backups over the dense transition tensor, every other method is one
+# of solvers.SOLVERS run on the sparse CSR model: "sparse" (Jacobi sweeps),
+# "gauss-seidel" (in-place sweeps in SWEEP_ORDER), "prioritized" (single-state
+# backups by largest Bellman residual), "policy-iteration" and
+# "modified-policy-iteration" (MPI_SWEEPS evaluation sweeps per improvement).
+# "tiled" streams Jacobi backups over TILE_ROWS row tiles into a
+# valuestore.ValueStore of VALUE_DTYPE values, memory-mapped under
+# VALUE_STORE_DIR when set; "parallel-tiled" splits those sweeps over
+# SOLVER_WORKERS processes.
+def vectorizedValueIteration(method="numpy", observer=None):
+    if observer is None:
+        observer = progressObserver()
+
+    env = environment()
+    if instrumentation.ACTIVE is not None and method != "prioritized":
+        observer = countingObserver(observer, env)
+    V0, active = env.cellRewards, env.active
+    if method == "numpy":
+        P, R = env.transitionTensor()
+        values, actions, iteration = solvers.denseValueIteration(P, R, V0, active, DISCOUNT_FACTOR, THRESHOLD, observer=observer)
+        print(f"Converged after {iteration} iterations.")
+    elif method in ("tiled", "parallel-tiled"):
+        shape = (env.rows, env.cols)
+        store = valuestore.ValueStore(env.rows, env.cols, VALUE_DTYPE, VALUE_STORE_DIR)
+        layout = (V0.reshape(shape), env.isObstacle.reshape(shape), active.reshape(shape), env.outcomeTable())
+        if method == "tiled":
+            values, actions, iteration = solvers.tiledValueIteration(*layout, DISCOUNT_FACTOR, THRESHOLD, store,
+                                                                     tileRows=TILE_ROWS, observer=observer)
+        else:
+            values, actions, iteration = solvers.parallelTiledValueIteration(*layout, DISCOUNT_FACTOR, THRESHOLD, store,
+                                                                             workers=SOLVER_WORKERS, tileRows=TILE_ROWS, observer=observer)
+        print(f"Converged after {iteration} iterations ({method}, {VALUE_DTYPE}).")
+        # the store's policy already has -1 for inactive states
+        return values, actions
+    else:
+        model = env.sparseModel()
+        options = {"observer": observer}
+        if method == "gauss-seidel":
+            options["order"] = env.sweepOrder(SWEEP_ORDER)
+        elif method == "modified-policy-iteration":
+            options["k"] = MPI_SWEEPS
+
+        values, actions, iteration = solvers.solve(method, model, V0, active, DISCOUNT_FACTOR, THRESHOLD, **options)
+
+        if method == "prioritized":
+            # single-state backups, no sweeps
+            instrumentation.count("backups", iteration)
+            instrumentation.count("transitions", iteration * outcomesPerBackup(env))
+            print(f"Converged after {iteration} backups (prioritized sweeping).")
+        elif method == "gauss-seidel":
+            print(f"Converged after {iteration} iterations ({method}, {SWEEP_ORDER} order).")
+        elif method == "sparse":
+            print(f"Converged after {iteration} iterations.")
+        else:
+            print(f"Converged after {iteration} iterations ({method}).")
+
+    return values, activePolicy(env, actions)
+
+
+# Wraps a vectorizedValueIteration() observer to count sweeps, backups and
+# transitions as valueIteration() does: every call is one sweep backing up
+# each active state under every action and outcome
+def countingObserver(observer, env):
+    backups = int(env.active.sum())
+    transitions = backups * outcomesPerBackup(env)
+
+    def counted(iteration, delta, elapsed, V):
+        instrumentation.count("sweeps")
+        instrumentation.count("backups", backups)
+        instrumentation.count("transitions", transitions)
+        with instrumentation.phase("vectorizedValueIteration.observer"):
+            observer(iteration, delta, elapsed, V)
+
+    return counted
+
+
+# Successor outcomes looked at by one state backup, over all actions
+def outcomesPerBackup(env):
+    return sum(len(env.actionOutcomes(action)) for action in ACTIONS)
+
+
+# Solver action indices as an int8 policy, -1 for terminal and obstacle states
+def activePolicy(env, actions):
+    return np.where(env.active, actions, -1).astype(np.int8)
+
+
+# Solves many layouts of the same shape at once with solvers.batchValueIteration().
+# configs is a list of GRID_CONFIG style dicts; returns one (values, policy)
+# pair of flat arrays per config, as vectorizedValueIteration() does.
+def solveConfigurations(configs, observer=None):
+    envs = [gridworld.getGridworld(**config) for config in configs]
+    values, actions, iterations = solvers.batchValueIteration(gridworld.stackGridworlds(envs), DISCOUNT_FACTOR, THRESHOLD, observer=observer)
+    print(f"Converged {len(envs)} gridworlds after {iterations.min()} to {iterations.max()} iterations.")
+
+    return [(V, activePolicy(env, actionIndices)) for env, V, actionIndices in zip(envs, values, actions)]
+
+
+# Sensitivity study over DISCOUNT_FACTOR and THRESHOLD values with
+# solvers.parameterSweep(), warm-starting each solve from the nearest solved
+# point. Prints iterations and timings per point and returns the SweepPoints.
+def sensitivitySweep(discounts, thresholds, method="sparse", warmStart=True):
+    env = environment()
+    options = {"order": env.sweepOrder(SWEEP_ORDER)} if method == "gauss-seidel" else {}
+    points = solvers.parameterSweep(env.sparseModel(), env.cellRewards, env.active, discounts, thresholds,
+                                    method=method, warmStart=warmStart, **options)
+
+    print(f"{'discount':>8} {'threshold':>10} {'iterations':>10} {'seconds':>8}  warm start")
+    for point in points:
+        source = "-" if point.warmStart is None else f"{point.warmStart[0]} / {point.warmStart[1]}"
+        print(f"{point.discount:>8} {point.threshold:>10} {point.iterations:>10} {point.seconds:>8.4f}  {source}")
+    print(f"Total: {sum(p.iterations for p in points)} iterations, {sum(p.seconds for p in points):.4f} seconds")
+
+    return points
+
+
+# True when env is small enough to print cell by cell, otherwise says so
+def printable(env):
+    if env.numStates <= PRINT_MAX_CELLS:
+        return True
+    print(f"({env.rows}x{env.cols} grid, not printed above PRINT_MAX_CELLS = {PRINT_MAX_CELLS} cells)")
+    return False
+
+
+# values is a flat array by state id; terminal and obstacle states print
+# their configured reward, as in the V dict of valueIteration(). Grids above
+# PRINT_MAX_CELLS are not printed.
+def visualizeV(values):
+    env = environment()
+    if not printable(env):
+        return
+    rewards = env.environmentModel().rewards
     i = 0
     row = []
-    for v in V.values():
-        row.append(round(v, 2))
-        if i == GRID_SIZE-1:
+    for state, v, active in zip(env.states, np.asarray(values).tolist(), env.active.tolist()):
+        row.append(round(v, 2) if active else rewards[state])
+        if i == env.cols-1:
             print(row)
             row = []
             i = 0
@@ -186,20 +354,20 @@ def visualizeV(V):
             i += 1
 
 
+# policy is an int8 action array by flat state id (Gridworld.policyArray())
 def visualizePolicy(policy):
-    bestActions = list(policy.values())
+    env = environment()
+    if not printable(env):
+        return
 
-    # inserts for obstacles/terminal states
-    bestActions.insert(12, "O")
-    bestActions.insert(17, "O")
-    bestActions.insert(22, "W")
-    bestActions.insert(24, "G")
+    # action letters, with markers for obstacles/terminal states
+    bestActions = env.policyLabels(policy)
 
     i = 0
     row = []
     for bestAction in bestActions:
         row.append(bestAction)
-        if i == GRID_SIZE-1:
+        if i == env.cols-1:
             print(row)
             row = []
             i = 0
@@ -207,64 +375,174 @@ def visualizePolicy(policy):
             i += 1
 
 
+# policy is an int8 action array by flat state id (Gridworld.policyArray()).
+# States are flat ids and every step is two list lookups in the policy's
+# precomputed next-state/reward table, or with STOCHASTIC a step sampled
+# from the slip dynamics (Gridworld.sampleStep()).
 def runOptimalPolicy(policy):
-    discountedReturns = []
+    with instrumentation.phase("runOptimalPolicy.setup"):
+        env = environment()
+        nextIndex, stepRewards = env.policySteps(policy)
+        nextIndex, stepRewards, isTerminal = nextIndex.tolist(), stepRewards.tolist(), env.isTerminal.tolist()
+        actions = np.asarray(policy).tolist()
+        rng = random.Random(SEED) if STOCHASTIC else None
+        stats = ReturnStatistics(HISTOGRAM_RANGE)
+    steps = 0
+
+    with instrumentation.phase("runOptimalPolicy.episodes"):
+        for episode in range(MAX_EPISODES):
+            currState = env.startIndex
+            discountedReturn = 0
+            timestep = 0
+
+            # episode ends in the goal or in water
+            while not isTerminal[currState]:
+
+                # get the next state and reward for the policy's action
+                if rng is None:
+                    nextState, reward = nextIndex[currState], stepRewards[currState]
+                else:
+                    nextState, reward = env.sampleStep(currState, actions[currState], rng.random())
+
+                # calculate discounted return
+                discountedReturn += reward * (DISCOUNT_FACTOR ** timestep)
+                timestep += 1
+
+                # update current state to next state
+                currState = nextState
+
+            # add the episodes final discounted return
+            stats.add(discountedReturn)
+            steps += timestep
+
+            # stop early once the estimate of the mean is tight enough
+            if (episode + 1) % CHECK_EVERY == 0 and stats.converged(TOLERANCE):
+                break
 
-    for episode in range(MAX_EPISODES):
-        currState = START_STATE
-        discountedReturn = 0
-        timestep = 0
+    instrumentation.count("episodes", stats.count)
+    instrumentation.count("steps", steps)
+    return stats
 
-        while currState != GOAL_STATE:
 
-            # choose optimal action from policy
-            action = policy[currState]
+# Step table and flat action array used by the array based simulators
+def rolloutArrays(policy):
+    nextStates, stepRewards, isTerminal = environment().stepTable()
+    return nextStates, stepRewards, isTerminal, np.asarray(policy)
 
-            # get next state and the reward for the action
-            nextState, reward = takeAction(currState, action)
 
-            # calculate discounted return
-            discountedReturn += reward * (DISCOUNT_FACTOR ** timestep)
-            timestep += 1
+# Same episodes as runOptimalPolicy(), simulated in lockstep by rollouts.streamRollouts()
+def batchedRunOptimalPolicy(policy, numEpisodes=None):
+    nextStates, stepRewards, isTerminal, actions = rolloutArrays(policy)
+    if numEpisodes is None:
+        numEpisodes = MAX_EPISODES
+    counters = {"steps": 0}
 
-            # update current state to next state
-            currState = nextState
+    stats = rollouts.streamRollouts(nextStates, stepRewards, isTerminal, environment().startIndex,
+                                    numEpisodes, DISCOUNT_FACTOR, policy=actions, rng=np.random.default_rng(SEED),
+                                    outcomes=environment().outcomeTable() if STOCHASTIC else None,
+                                    stats=ReturnStatistics(HISTOGRAM_RANGE), tolerance=TOLERANCE, counters=counters)
+    instrumentation.count("episodes", stats.count)
+    instrumentation.count("steps", counters["steps"])
+    return stats
 
-            # if agent in water, go to next episode
-            if currState == WATER_STATE:
-                break
 
-        # add the episodes final discounted return
-        discountedReturns.append(discountedReturn)
+# Same episodes as batchedRunOptimalPolicy(), sharded over WORKERS processes
+def parallelRunOptimalPolicy(policy, numEpisodes=None, workers=None):
+    nextStates, stepRewards, isTerminal, actions = rolloutArrays(policy)
+    if numEpisodes is None:
+        numEpisodes = MAX_EPISODES
+    counters = {"steps": 0}
 
-    return discountedReturns
+    stats = rollouts.parallelRollouts(nextStates, stepRewards, isTerminal, environment().startIndex,
+                                      numEpisodes, DISCOUNT_FACTOR, policy=actions, seed=SEED,
+                                      outcomes=environment().outcomeTable() if STOCHASTIC else None,
+                                      workers=WORKERS if workers is None else workers, histogramRange=HISTOGRAM_RANGE,
+                                      tolerance=TOLERANCE, counters=counters)
+    instrumentation.count("episodes", stats.count)
+    instrumentation.count("steps", counters["steps"])
+    return stats
+
+
+# Solves the current layout with SOLVER and returns the flat values and the
+# policy as an int8 action array. With CACHE set the solution is loaded from
+# the policy cache, as read-only memory-mapped arrays, when this layout,
+# dynamics, DISCOUNT_FACTOR, THRESHOLD and SOLVER were solved before by the
+# same code (the key hashes this file and the solver modules), and stored
+# there otherwise. Solutions in a VALUE_STORE_DIR store stay out of the cache:
+# they are on disk already and would not fit it.
+def solve():
+    with instrumentation.phase("solve"):
+        return _solve()
+
+
+def _solve():
+    env = environment()
+    cache = policycache.PolicyCache(sources=[__file__]) if CACHE else None
+    if SOLVER in ("tiled", "parallel-tiled") and VALUE_STORE_DIR is not None:
+        cache = None
+
+    if cache is not None:
+        cached = cache.load(env, DISCOUNT_FACTOR, THRESHOLD, SOLVER)
+        if cached is not None:
+            print(f"Loaded cached solution from {cache.directory}")
+            return cached
+
+    if SOLVER in ("numpy", "tiled", "parallel-tiled") or SOLVER in solvers.SOLVERS:
+        values, policy = vectorizedValueIteration(SOLVER)
+    else:
+        values, policy = env.fromDicts(*valueIteration())
+
+    if cache is not None:
+        cache.store(env, DISCOUNT_FACTOR, THRESHOLD, SOLVER, values, policy)
+
+    return values, policy
+
+
+# Runs main(), under an instrumentation.Instrumentation with INSTRUMENT set
+def instrumentedMain():
+    if not INSTRUMENT:
+        return main()
+
+    with instrumentation.Instrumentation("value-iteration", PROFILER) as probe:
+        main()
+    probe.writeReport(REPORT_FILE)
+    print(f"Run report written to {REPORT_FILE}")
 
 
 def main():
-    V, policy = valueIteration()
+    values, policy = solve()
 
     print()
     print("Optimal Value Function")
-    visualizeV(V)
+    visualizeV(values)
 
     print()
     print("Optimal Policy")   
     visualizePolicy(policy)
 
-    returns = runOptimalPolicy(policy)
+    with instrumentation.phase("simulate"):
+        if SIMULATOR == "parallel":
+            stats = parallelRunOptimalPolicy(policy)
+        elif SIMULATOR == "batched":
+            stats = batchedRunOptimalPolicy(policy)
+        else:
+            stats = runOptimalPolicy(policy)
 
-    mean_return = np.mean(returns)
-    std_return = np.std(returns)
-    max_return = np.max(returns)
-    min_return = np.min(returns)
+    summary = stats.summary()
+    mean_return = summary["mean"]
+    std_return = summary["std"]
+    max_return = summary["max"]
+    min_return = summary["min"]
 
     print()
     print(f"Mean discounted return: {mean_return:.2f}")
     print(f"Standard deviation of discounted returns: {std_return:.2f}")
     print(f"Maximum discounted return: {max_return:.2f}")
     print(f"Minimum discounted return: {min_return:.2f}")
+    print(f"Episodes used: {summary['count']}")
+    print(f"95% confidence interval of the mean: [{summary['ciLow']:.2f}, {summary['ciHigh']:.2f}]")
 
 
 
 if __name__ == '__main__':
-    main()
+    instrumentedMain()
@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+
+import numpy as np
+
+# Flat array storage for value functions and policies of large grids, used by
+# solvers.tiledValueIteration(). Values are (rows, cols) float32 or float64
+# arrays and the policy an int8 array of action indices (-1 where a state has
+# no action), 4-8 bytes and 1 byte per state instead of the ~100+ bytes of a
+# dict entry. With a directory the arrays are .npy files opened with
+# np.lib.format.open_memmap, so only the pages of the tiles being backed up
+# need to be resident and grids larger than RAM can be solved.
+#
+# Jacobi value iteration needs the previous and the new value function; the
+# store keeps both (values and scratch) and swaps them after every sweep.
+
+VALUES_FILE = "V.npy"
+SCRATCH_FILE = "V.scratch.npy"
+POLICY_FILE = "policy.npy"
+
+
+class ValueStore:
+
+    def __init__(self, rows, cols, dtype=np.float64, directory=None):
+        self.rows = rows
+        self.cols = cols
+        self.dtype = np.dtype(dtype)
+        self.directory = directory
+
+        if directory is None:
+            self.values = np.empty((rows, cols), dtype=self.dtype)
+            self.scratch = np.empty((rows, cols), dtype=self.dtype)
+            self.policy = np.full((rows, cols), -1, dtype=np.int8)
+        else:
+            os.makedirs(directory, exist_ok=True)
+            self.values = self._open(VALUES_FILE, self.dtype)
+            self.scratch = self._open(SCRATCH_FILE, self.dtype)
+            self.policy = self._open(POLICY_FILE, np.int8)
+            self.policy[:] = -1
+
+    def _open(self, name, dtype):
+        return np.lib.format.open_memmap(os.path.join(self.directory, name), mode="w+", dtype=dtype, shape=(self.rows, self.cols))
+
+    # Bytes held by the value, scratch and policy arrays
+    @property
+    def nbytes(self):
+        return sum(array.nbytes for array in (self.values, self.scratch, self.policy) if array is not None)
+
+    # Copies initial values (e.g. Gridworld.cellRewards) into values and
+    # scratch, tileRows rows at a time. Both buffers need the fixed values of
+    # the terminal and obstacle states.
+    def initialize(self, V0, tileRows):
+        for r0 in range(0, self.rows, tileRows):
+            r1 = min(r0 + tileRows, self.rows)
+            self.values[r0:r1] = V0[r0:r1]
+            self.scratch[r0:r1] = V0[r0:r1]
+
+    def swap(self):
+        self.values, self.scratch = self.scratch, self.values
+
+    def flush(self):
+        for array in (self.values, self.scratch, self.policy):
+            if isinstance(array, np.memmap):
+                array.flush()
+
+    # Drops the scratch buffer once solving is done, moving the solution into
+    # VALUES_FILE when it ended up in the scratch file
+    def finish(self):
+        if self.directory is None:
+            self.scratch = None
+            return
+
+        self.flush()
+        valuesPath = os.path.join(self.directory, VALUES_FILE)
+        scratchPath = os.path.join(self.directory, SCRATCH_FILE)
+        if os.path.abspath(self.values.filename) == os.path.abspath(scratchPath):
+            del self.values, self.scratch
+            os.replace(scratchPath, valuesPath)
+        else:
+            del self.scratch
+            os.remove(scratchPath)
+        self.values = np.load(valuesPath, mmap_mode="r+")
+        self.scratch = None
+
+    # Opens the values and policy a finished store left in directory
+    @classmethod
+    def load(cls, directory, mode="r"):
+        store = cls.__new__(cls)
+        store.directory = directory
+        store.values = np.load(os.path.join(directory, VALUES_FILE), mmap_mode=mode)
+        store.policy = np.load(os.path.join(directory, POLICY_FILE), mmap_mode=mode)
+        store.scratch = None
+        store.rows, store.cols = store.values.shape
+        store.dtype = store.values.dtype
+        return store